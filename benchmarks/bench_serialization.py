@@ -0,0 +1,67 @@
+"""Compares the serialization fast path with the stdlib json path.
+
+Run with:
+
+    PYTHONPATH=$PYTHONPATH:$(pwd) pipenv run python benchmarks/bench_serialization.py
+
+The "current" rows reproduce what happens without newsie.serialization:
+NewsAPI responses decoded with json.loads into full article dicts, and block
+lists encoded as part of the Slack request body by json.dumps. The
+slim_response row shows the extra CPU spent trimming articles, which only the
+streaming pipeline pays.
+"""
+import json
+import timeit
+
+from newsie import serialization
+from newsie.slack import SlackFacade
+
+
+def make_payload(n=100):
+    articles = [{
+        "source": {"id": f"source-{i}", "name": f"Source {i}"},
+        "author": f"Author {i}",
+        "title": f"Headline number {i} about something happening today",
+        "description": "A fairly typical description of the article. " * 3,
+        "url": f"https://example.com/articles/{i}",
+        "urlToImage": f"https://example.com/images/{i}.jpg",
+        "publishedAt": "2021-03-01T01:01:01Z",
+        "content": "Body text of the article that gets truncated… [+2345 chars]" * 4,
+    } for i in range(n)]
+    return {"status": "ok", "totalResults": n, "articles": articles}
+
+
+def bench(label, func, number):
+    seconds = min(timeit.repeat(func, number=number, repeat=5)) / number
+    print(f"  {label:<40} {seconds * 1e6:10.1f} us")
+
+
+def main():
+    raw = json.dumps(make_payload()).encode("utf-8")
+    slack = SlackFacade(token="bench")
+    articles = serialization.slim_response(json.loads(raw))["articles"]
+    blocks = [
+        slack.create_rich_message_layout("bench", articles[i:i + 8], cont=i > 0)
+        for i in range(0, len(articles), 8)
+    ]
+
+    backend = "orjson" if serialization.orjson is not None else "stdlib json"
+    print(f"Fast path backend: {backend}")
+
+    print("Decode 100-article NewsAPI response:")
+    bench("current (json.loads)", lambda: json.loads(raw), 200)
+    bench("fast path (loads)", lambda: serialization.loads(raw), 200)
+    bench("fast path (loads + slim_response)",
+          lambda: serialization.slim_response(serialization.loads(raw)), 200)
+
+    print(f"Encode {len(blocks)} Slack request bodies:")
+    bench("current (json.dumps of blocks)",
+          lambda: [json.dumps({"channel": "#c", "blocks": b}) for b in blocks], 200)
+    bench("fast path (encode_blocks)",
+          lambda: [json.dumps({"channel": "#c",
+                               "blocks": serialization.encode_blocks(b)})
+                   for b in blocks], 200)
+
+
+if __name__ == "__main__":
+    main()
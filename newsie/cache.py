@@ -0,0 +1,92 @@
+import json
+import logging
+import os
+import threading
+import time
+
+
+class JsonFileCache(object):
+
+    def __init__(self, path, ttl=None, max_entries=None):
+        """Constructs a small persistent key/value cache backed by a json file.
+
+        Entries are held in memory and only written back to disk on save(), so
+        the cache is cheap to read from worker threads.
+
+        Args:
+            path: string, the file used to persist the cache. If None, the
+                cache lives in memory only.
+            ttl: int, number of seconds an entry is valid for. None means
+                entries never expire.
+            max_entries: int, the number of entries to keep. The least
+                recently set entries are evicted first. None means no limit.
+        """
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = self._load()
+
+    def _load(self):
+        """Loads the cache entries from disk, ignoring unreadable files."""
+        if not self.path or not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logging.warning(f"Could not read cache file {self.path}: {e}")
+            return {}
+
+    def _is_expired(self, entry, now):
+        ttl = entry.get("ttl", self.ttl)
+        return ttl is not None and now - entry["ts"] > ttl
+
+    def get(self, key, default=None):
+        """Returns the cached value for key, or default if missing/expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or self._is_expired(entry, time.time()):
+                return default
+            return entry["value"]
+
+    def set(self, key, value, ttl=None):
+        """Stores a json serializable value for key.
+
+        Args:
+            key: string, the cache key.
+            value: A json serializable value.
+            ttl: int, seconds this entry is valid for. Defaults to the
+                cache's ttl.
+        """
+        entry = {"ts": time.time(), "value": value}
+        if ttl is not None:
+            entry["ttl"] = ttl
+        with self._lock:
+            # Re-insert so entries stay ordered from least to most recently set.
+            self._entries.pop(key, None)
+            self._entries[key] = entry
+            if self.max_entries is not None:
+                while len(self._entries) > self.max_entries:
+                    del self._entries[next(iter(self._entries))]
+
+    def __contains__(self, key):
+        return self.get(key, self) is not self
+
+    def __len__(self):
+        return len(self._entries)
+
+    def save(self):
+        """Writes the non-expired entries back to disk."""
+        if not self.path:
+            return
+        now = time.time()
+        with self._lock:
+            self._entries = {
+                key: entry for key, entry in self._entries.items()
+                if not self._is_expired(entry, now)
+            }
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(self._entries, f)
+            os.replace(tmp_path, self.path)
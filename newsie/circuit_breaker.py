@@ -0,0 +1,100 @@
+import logging
+import threading
+import time
+
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """Raised when a call is rejected because the circuit is open."""
+
+
+class CircuitBreaker(object):
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=60):
+        """Constructs a circuit breaker.
+
+        The breaker opens after failure_threshold consecutive failures and
+        rejects calls until reset_timeout seconds have passed. It then lets a
+        single trial call through (half open); a success closes the circuit,
+        a failure opens it again.
+
+        Args:
+            name: string, used when logging state changes.
+            failure_threshold: int, consecutive failures before opening.
+            reset_timeout: int, seconds to stay open before a trial call.
+        """
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = None
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self):
+        if (self._state == OPEN
+                and time.monotonic() - self._opened_at >= self.reset_timeout):
+            self._state = HALF_OPEN
+        return self._state
+
+    def allow_request(self):
+        """Returns True if a call may go through.
+
+        While half open, only the first caller gets through; the circuit is
+        treated as open for everyone else until that call is recorded.
+        """
+        with self._lock:
+            state = self._current_state()
+            if state == CLOSED:
+                return True
+            if state == HALF_OPEN:
+                # Re-open until the trial call reports back.
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self._state != CLOSED:
+                logging.info(f"Circuit {self.name} closed.")
+            self._state = CLOSED
+            self._failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state != OPEN and self._failures >= self.failure_threshold:
+                logging.warning(
+                    f"Circuit {self.name} opened after {self._failures} failures.")
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+            elif self._state == OPEN:
+                self._opened_at = time.monotonic()
+
+    def call(self, func, *args, **kwargs):
+        """Calls func through the breaker.
+
+        Raises:
+            CircuitOpenError if the circuit is open. Any exception raised by
+            func is recorded as a failure and re-raised.
+        """
+        if not self.allow_request():
+            raise CircuitOpenError(f"Circuit {self.name} is open.")
+        try:
+            result = func(*args, **kwargs)
+        except Exception:
+            self.record_failure()
+            raise
+        self.record_success()
+        return result
@@ -5,11 +5,23 @@ from newsie.query_helper import QueryHelper
 
 LOGFILE = os.environ.get("LOGFILE", "/tmp/newsielog")
 
+# Sent with the requests we make to article pages and images.
+USER_AGENT = "Mozilla/5.0 (compatible; Newsie/1.0)"
+
 NEWS_API_KEY = os.environ.get("NEWS_API_KEY")
 SLACK_BOT_TOKEN = os.environ.get("SLACK_BOT_TOKEN")
 SLACK_BOT_NAME = os.environ.get("SLACK_BOT_NAME", "Newsie")
 DEFAULT_SLACK_CHANNEL = os.environ.get("DEFAULT_SLACK_CHANNEL", "#news-results")
 
+# How repeated digests for the same query and channel are sent: "post" posts
+# new messages every run, "update" edits the previous digest in place and
+# "thread" replies to it with only the new articles. Digests older than
+# SLACK_DIGEST_MAX_AGE seconds are posted afresh.
+SLACK_UPDATE_MODE = os.environ.get("SLACK_UPDATE_MODE", "post")
+SLACK_MESSAGE_STORE_FILE = os.environ.get(
+    "SLACK_MESSAGE_STORE_FILE", "/tmp/newsie_slack_messages.json")
+SLACK_DIGEST_MAX_AGE = 24 * 60 * 60
+
 # Pytz timezone string. You can see a full list here:
 # https://gist.github.com/heyalexej/8bf688fd67d7199be4a1682b3eec7568
 # or by calling pytz.all_timezones
@@ -19,6 +31,79 @@ TIMEZONE = "America/New_York"
 # E.g. "us" for USA. Defaults to all.
 COUNTRY_CODE = "us"
 
+# NewsAPI's maximum page size.
+MAX_PAGE_SIZE = 100
+
+# NewsAPI request policy. Transient failures are retried with exponential
+# backoff; after NEWS_API_BREAKER_FAILURES failures in a row the circuit
+# breaker opens for NEWS_API_BREAKER_RESET seconds and the last good response
+# (kept in NEWS_API_RESPONSE_CACHE_FILE) is used instead. With hedging on, a
+# duplicate request is sent when one takes longer than the p95 of recent
+# requests, which are remembered across runs in the response cache file.
+NEWS_API_TIMEOUT = 10
+NEWS_API_RETRIES = 2
+NEWS_API_BACKOFF = 0.5
+NEWS_API_BREAKER_FAILURES = 5
+NEWS_API_BREAKER_RESET = 5 * 60
+NEWS_API_HEDGE_ENABLED = False
+NEWS_API_HEDGE_MIN_SAMPLES = 20
+NEWS_API_RESPONSE_CACHE_FILE = os.environ.get(
+    "NEWS_API_RESPONSE_CACHE_FILE", "/tmp/newsie_newsapi_cache.json")
+NEWS_API_RESPONSE_CACHE_TTL = 24 * 60 * 60
+NEWS_API_RESPONSE_CACHE_ENTRIES = 100
+
+# Adaptive fetch budget. When enabled, per-query stats are kept in
+# QUERY_STATS_FILE and used to pick each query's page size, page count and
+# refresh interval. Run `python -m newsie.query_stats` for a report.
+ADAPTIVE_FETCH_ENABLED = False
+QUERY_STATS_FILE = os.environ.get(
+    "QUERY_STATS_FILE", "/tmp/newsie_query_stats.json")
+QUERY_STATS_HISTORY = 20
+QUERY_STATS_SEEN_URLS = 2000
+ADAPTIVE_MIN_PAGE_SIZE = 10
+ADAPTIVE_MAX_PAGES = 3
+ADAPTIVE_HEADROOM = 1.5
+# Extra pages are only fetched while less than this share of fetched
+# articles are duplicates and runs average less than this many seconds.
+ADAPTIVE_MAX_DUPLICATE_RATE = 0.5
+ADAPTIVE_MAX_LATENCY = 5.0
+# Queries with a lower share of new articles are refreshed less often, in
+# proportion to their yield, up to ADAPTIVE_MAX_REFRESH_INTERVAL seconds.
+ADAPTIVE_LOW_YIELD_RATE = 0.1
+ADAPTIVE_MAX_REFRESH_INTERVAL = 24 * 60 * 60
+
+# Streaming mode (runner.py --stream). Articles flow through a bounded
+# fetch -> normalize -> filter -> format -> send pipeline, so memory stays flat
+# however many articles there are. At most PIPELINE_QUEUE_SIZE items of
+# PIPELINE_BATCH_SIZE articles wait between two stages, and duplicates are
+# detected among the last PIPELINE_DEDUP_WINDOW urls of each query.
+PIPELINE_QUEUE_SIZE = 16
+PIPELINE_BATCH_SIZE = 50
+PIPELINE_DEDUP_WINDOW = 10000
+
+# Optional enrichment stage. When enabled, article pages are fetched to fill
+# in missing images/descriptions and to build a short extractive summary.
+ENRICHMENT_ENABLED = False
+ENRICHMENT_CACHE_FILE = os.environ.get(
+    "ENRICHMENT_CACHE_FILE", "/tmp/newsie_enrichment_cache.json")
+ENRICHMENT_CACHE_TTL = 7 * 24 * 60 * 60
+ENRICHMENT_CACHE_ENTRIES = 5000
+ENRICHMENT_TIMEOUT = 5
+ENRICHMENT_MAX_WORKERS = 8
+ENRICHMENT_PER_HOST_LIMIT = 2
+ENRICHMENT_SUMMARY_SENTENCES = 2
+
+# Optional background image probe. Image urls are checked with HEAD requests
+# and known-bad images are swapped for the placeholder on later posts.
+IMAGE_PROBE_ENABLED = False
+IMAGE_PROBE_CACHE_FILE = os.environ.get(
+    "IMAGE_PROBE_CACHE_FILE", "/tmp/newsie_image_probe_cache.json")
+IMAGE_PROBE_TTL = 24 * 60 * 60
+IMAGE_PROBE_TIMEOUT = 3
+IMAGE_PROBE_MAX_WORKERS = 8
+IMAGE_PROBE_HOST_FAILURES = 3
+IMAGE_PROBE_HOST_RESET = 10 * 60
+
 # Query objects for us to use in our application
 QUERIES = [
 
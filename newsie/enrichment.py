@@ -0,0 +1,271 @@
+import codecs
+import collections
+import http.client
+import logging
+import re
+import threading
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from html.parser import HTMLParser
+
+from newsie import config
+from newsie.cache import JsonFileCache
+
+
+# NewsAPI cuts descriptions and content off with an ellipsis or a
+# "[+1234 chars]" marker.
+TRUNCATED_RE = re.compile(r"(…|\.\.\.|\[\+\d+ chars\])\s*$")
+SENTENCE_RE = re.compile(r"(?<=[.!?])\s+(?=[A-Z0-9\"'])")
+# urlopen also follows file:// and ftp:// urls, which an article should
+# never make us read.
+HTTP_SCHEMES = ("http", "https")
+WORD_RE = re.compile(r"[a-z']+")
+
+STOPWORDS = frozenset(
+    "a an and are as at be but by for from has have he her his i in is it its "
+    "of on or said she that the their there they this to was were which who "
+    "will with would you".split()
+)
+
+
+class PageMetadataParser(HTMLParser):
+
+    def __init__(self, max_text_chars=20000):
+        """Collects OpenGraph metadata and paragraph text from an html page.
+
+        Args:
+            max_text_chars: int, stop collecting paragraph text after this
+                many characters.
+        """
+        super().__init__(convert_charrefs=True)
+        self.max_text_chars = max_text_chars
+        self.meta = {}
+        self.paragraphs = []
+        self._in_paragraph = False
+        self._current = []
+        self._text_chars = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "meta":
+            attrs = dict(attrs)
+            key = attrs.get("property") or attrs.get("name")
+            content = attrs.get("content")
+            if key and content and key.lower() not in self.meta:
+                self.meta[key.lower()] = content.strip()
+        elif tag == "p" and self._text_chars < self.max_text_chars:
+            self._in_paragraph = True
+            self._current = []
+
+    def handle_endtag(self, tag):
+        if tag == "p" and self._in_paragraph:
+            self._in_paragraph = False
+            text = " ".join("".join(self._current).split())
+            if text:
+                self.paragraphs.append(text)
+                self._text_chars += len(text)
+
+    def handle_data(self, data):
+        if self._in_paragraph:
+            self._current.append(data)
+
+    @property
+    def image(self):
+        return self.meta.get("og:image") or self.meta.get("twitter:image")
+
+    @property
+    def description(self):
+        return (
+            self.meta.get("og:description")
+            or self.meta.get("twitter:description")
+            or self.meta.get("description")
+        )
+
+    @property
+    def text(self):
+        return " ".join(self.paragraphs)
+
+
+def is_truncated(text):
+    """Returns True if text is missing or was cut off by NewsAPI."""
+    return not text or TRUNCATED_RE.search(text) is not None
+
+
+def summarize(text, max_sentences=2):
+    """Builds an extractive summary by scoring sentences on word frequency.
+
+    Args:
+        text: string, the article body.
+        max_sentences: int, the number of sentences to keep.
+    Returns:
+        The highest scoring sentences joined in their original order, or None
+        if there is no text to summarize.
+    """
+    sentences = [s.strip() for s in SENTENCE_RE.split(text or "") if s.strip()]
+    if not sentences:
+        return None
+    if len(sentences) <= max_sentences:
+        return " ".join(sentences)
+
+    frequencies = collections.Counter(
+        word for word in WORD_RE.findall(text.lower()) if word not in STOPWORDS
+    )
+    scores = []
+    for ind, sentence in enumerate(sentences):
+        words = [w for w in WORD_RE.findall(sentence.lower()) if w not in STOPWORDS]
+        score = sum(frequencies[w] for w in words) / (len(words) or 1)
+        scores.append((score, ind))
+
+    keep = sorted(ind for _, ind in sorted(scores, reverse=True)[:max_sentences])
+    return " ".join(sentences[ind] for ind in keep)
+
+
+class ArticleEnricher(object):
+
+    def __init__(self, cache=None, timeout=config.ENRICHMENT_TIMEOUT,
+                 max_workers=config.ENRICHMENT_MAX_WORKERS,
+                 per_host_limit=config.ENRICHMENT_PER_HOST_LIMIT,
+                 summary_sentences=config.ENRICHMENT_SUMMARY_SENTENCES,
+                 max_bytes=512 * 1024):
+        """Constructs the enricher used to fill in missing article metadata.
+
+        Args:
+            cache: A cache.JsonFileCache keyed by article url. Defaults to the
+                file set in config.ENRICHMENT_CACHE_FILE, bounded by
+                config.ENRICHMENT_CACHE_TTL/ENRICHMENT_CACHE_ENTRIES.
+            timeout: int, seconds to wait on each page fetch.
+            max_workers: int, the number of pages fetched concurrently.
+            per_host_limit: int, the number of concurrent connections allowed
+                to a single host.
+            summary_sentences: int, the number of sentences in the summary.
+            max_bytes: int, the maximum number of bytes read from a page.
+        """
+        self.cache = cache if cache is not None else JsonFileCache(
+            config.ENRICHMENT_CACHE_FILE, ttl=config.ENRICHMENT_CACHE_TTL,
+            max_entries=config.ENRICHMENT_CACHE_ENTRIES)
+        self.timeout = timeout
+        self.max_workers = max_workers
+        self.per_host_limit = per_host_limit
+        self.summary_sentences = summary_sentences
+        self.max_bytes = max_bytes
+
+        self._host_locks = {}
+        self._host_locks_lock = threading.Lock()
+
+    def _host_semaphore(self, url):
+        """Returns the semaphore limiting connections to url's host."""
+        host = urllib.parse.urlsplit(url).netloc.lower()
+        with self._host_locks_lock:
+            if host not in self._host_locks:
+                self._host_locks[host] = threading.BoundedSemaphore(
+                    self.per_host_limit)
+            return self._host_locks[host]
+
+    def fetch_page(self, url):
+        """Fetches the page at url.
+
+        Returns:
+            A (html, final_url) tuple with the decoded html, limited to
+            max_bytes, and the url the page was served from after redirects.
+        Raises:
+            ValueError if url isn't an http(s) url.
+        """
+        if urllib.parse.urlsplit(url).scheme not in HTTP_SCHEMES:
+            raise ValueError(f"Not an http(s) url: {url}")
+        request = urllib.request.Request(url, headers={"User-Agent": config.USER_AGENT})
+        with self._host_semaphore(url):
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                charset = response.headers.get_content_charset() or "utf-8"
+                body = response.read(self.max_bytes)
+                final_url = response.geturl()
+        try:
+            codecs.lookup(charset)
+        except LookupError:
+            logging.warning(f"Unknown charset {charset} for {url}, using utf-8.")
+            charset = "utf-8"
+        return body.decode(charset, errors="replace"), final_url
+
+    def fetch_metadata(self, url):
+        """Fetches and parses the page metadata for url.
+
+        Args:
+            url: string, the article url.
+        Returns:
+            Dict with the image, description and summary found on the page, or
+            None if the page could not be retrieved.
+        """
+        try:
+            html, page_url = self.fetch_page(url)
+        except (urllib.error.URLError, http.client.HTTPException, OSError,
+                ValueError) as e:
+            logging.warning(f"Could not fetch {url} for enrichment: {e}")
+            return None
+
+        parser = PageMetadataParser()
+        parser.feed(html)
+        summary = summarize(parser.text, self.summary_sentences)
+        image = None
+        if parser.image:
+            # og:image is often relative to the page, which Slack rejects.
+            image = urllib.parse.urljoin(page_url, parser.image)
+            if urllib.parse.urlsplit(image).scheme not in HTTP_SCHEMES:
+                image = None
+        return {
+            "image": image,
+            "description": parser.description,
+            "summary": summary.rstrip(".") if summary else None,
+        }
+
+    def _get_metadata(self, url):
+        """Returns the metadata for url, fetching it if it isn't cached."""
+        metadata = self.cache.get(url)
+        if metadata is None:
+            metadata = self.fetch_metadata(url)
+            if metadata is not None:
+                self.cache.set(url, metadata)
+        return metadata
+
+    def _needs_enrichment(self, article):
+        return bool(article.get("url")) and (
+            not article.get("urlToImage")
+            or is_truncated(article.get("description"))
+            or "summary" not in article
+        )
+
+    def apply_metadata(self, article, metadata):
+        """Returns a copy of article with the missing fields filled in."""
+        article = dict(article)
+        if not metadata:
+            return article
+        if not article.get("urlToImage") and metadata.get("image"):
+            article["urlToImage"] = metadata["image"]
+        if is_truncated(article.get("description")) and metadata.get("description"):
+            article["description"] = metadata["description"]
+        if metadata.get("summary"):
+            article["summary"] = metadata["summary"]
+        return article
+
+    def enrich(self, articles):
+        """Enriches a list of newsapi articles with their page metadata.
+
+        Pages are fetched concurrently; articles whose pages can't be fetched
+        are returned untouched.
+
+        Args:
+            articles: A list of newsapi article responses.
+        Returns:
+            A new list of articles, in the same order.
+        """
+        urls = list(dict.fromkeys(
+            a["url"] for a in articles if self._needs_enrichment(a)))
+        logging.info(f"Enriching {len(urls)} articles...")
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            metadata = dict(zip(urls, executor.map(self._get_metadata, urls)))
+
+        self.cache.save()
+        return [
+            self.apply_metadata(article, metadata.get(article.get("url")))
+            for article in articles
+        ]
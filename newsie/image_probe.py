@@ -0,0 +1,141 @@
+import logging
+import socket
+import threading
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from newsie import config
+from newsie.cache import JsonFileCache
+from newsie.circuit_breaker import OPEN, CircuitBreaker
+
+
+class ImageProbe(object):
+
+    def __init__(self, cache=None, timeout=config.IMAGE_PROBE_TIMEOUT,
+                 max_workers=config.IMAGE_PROBE_MAX_WORKERS,
+                 host_failure_threshold=config.IMAGE_PROBE_HOST_FAILURES,
+                 host_reset_timeout=config.IMAGE_PROBE_HOST_RESET):
+        """Constructs the background image probe.
+
+        Image urls are checked with HEAD requests on a thread pool and the
+        verdicts are written to a TTL cache. Lookups only ever read the
+        cache, so posting never waits on a probe.
+
+        Args:
+            cache: A cache.JsonFileCache mapping image url to a bool verdict.
+                Defaults to config.IMAGE_PROBE_CACHE_FILE with a ttl of
+                config.IMAGE_PROBE_TTL.
+            timeout: int, seconds to wait on each HEAD request.
+            max_workers: int, the number of concurrent probes.
+            host_failure_threshold: int, consecutive connection failures to a
+                host before its images are marked bad without probing.
+            host_reset_timeout: int, seconds before a failing host is retried.
+        """
+        self.cache = cache if cache is not None else JsonFileCache(
+            config.IMAGE_PROBE_CACHE_FILE, ttl=config.IMAGE_PROBE_TTL)
+        self.timeout = timeout
+        self.host_failure_threshold = host_failure_threshold
+        self.host_reset_timeout = host_reset_timeout
+
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._lock = threading.Lock()
+        self._pending = set()
+        self._breakers = {}
+
+    def _breaker(self, host):
+        with self._lock:
+            if host not in self._breakers:
+                self._breakers[host] = CircuitBreaker(
+                    host, self.host_failure_threshold, self.host_reset_timeout)
+            return self._breakers[host]
+
+    def is_bad(self, url):
+        """Returns True if url is known to be a broken image. Never blocks.
+
+        Images on a host whose breaker is open are treated as bad until the
+        breaker resets, without recording a verdict for them.
+        """
+        if not url:
+            return False
+        if self.cache.get(url) is False:
+            return True
+        with self._lock:
+            breaker = self._breakers.get(urllib.parse.urlsplit(url).netloc.lower())
+        return breaker is not None and breaker.state == OPEN
+
+    def submit(self, urls):
+        """Schedules probes for any urls without a cached verdict.
+
+        Args:
+            urls: An iterable of image urls. Empty values are skipped.
+        """
+        with self._lock:
+            new_urls = [
+                url for url in dict.fromkeys(urls)
+                if url and url not in self._pending and url not in self.cache
+            ]
+            self._pending.update(new_urls)
+
+        for url in new_urls:
+            self._executor.submit(self._probe, url)
+
+    def check(self, url):
+        """Sends a HEAD request for url.
+
+        Returns:
+            True if the url serves an image, False if it doesn't and None if
+            the server doesn't support HEAD requests. Urls that aren't http(s)
+            are never opened and are always bad.
+        Raises:
+            OSError (including timeouts) if the host couldn't be reached.
+        """
+        # urlopen would happily read file:// urls from the local disk.
+        if urllib.parse.urlsplit(url).scheme not in ("http", "https"):
+            return False
+        request = urllib.request.Request(
+            url, method="HEAD", headers={"User-Agent": config.USER_AGENT})
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                content_type = response.headers.get("Content-Type", "image/")
+                return content_type.startswith("image/")
+        except urllib.error.HTTPError as e:
+            if e.code in (405, 501):
+                return None
+            return False
+
+    def _probe(self, url):
+        try:
+            breaker = self._breaker(urllib.parse.urlsplit(url).netloc.lower())
+            if not breaker.allow_request():
+                # Leave the url unprobed so it's retried once the host recovers.
+                return
+            try:
+                verdict = self.check(url)
+            except ValueError:
+                # Not a url we can fetch at all; the host isn't to blame.
+                self.cache.set(url, False, ttl=self.host_reset_timeout)
+                return
+            except (urllib.error.URLError, socket.timeout, OSError) as e:
+                logging.warning(f"Image probe failed for {url}: {e}")
+                breaker.record_failure()
+                # A failed connection says little about the image itself, so
+                # only remember it for as long as the host is skipped.
+                self.cache.set(url, False, ttl=self.host_reset_timeout)
+                return
+            breaker.record_success()
+            if verdict is not None:
+                self.cache.set(url, verdict)
+        finally:
+            with self._lock:
+                self._pending.discard(url)
+
+    def close(self, wait=True):
+        """Shuts down the probe pool and persists the cache.
+
+        Args:
+            wait: bool, whether to let queued probes finish first.
+        """
+        self._executor.shutdown(wait=wait, cancel_futures=not wait)
+        self.cache.save()
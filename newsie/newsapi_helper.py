@@ -1,32 +1,226 @@
+import collections
+import json
 import logging
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 
+import requests
 from newsapi import NewsApiClient
+from newsapi.newsapi_exception import NewsAPIException
 
 from newsie import config
+from newsie import serialization
+from newsie.cache import JsonFileCache
+from newsie.circuit_breaker import CircuitBreaker, CircuitOpenError
+
+
+# NewsAPI error codes worth retrying. Everything else (bad key, rate limited,
+# bad parameters) will fail the same way again.
+TRANSIENT_ERROR_CODES = frozenset(["unexpectedError"])
+
+# Response cache key under which request latencies are kept between runs, so
+# hedging has enough samples even though each run only makes a few requests.
+LATENCIES_CACHE_KEY = "latencies"
+
+
+def _fast_json_hook(response, *args, **kwargs):
+    """Swaps a response's json decoder for the fast path in serialization."""
+    response.json = lambda **kw: serialization.loads(response.content)
+    return response
+
+
+def is_transient(error):
+    """Returns True if a failed NewsAPI call is worth retrying."""
+    if isinstance(error, NewsAPIException):
+        return error.get_exception().get("code") in TRANSIENT_ERROR_CODES
+    # JSONDecodeError covers error pages that aren't json; orjson's decode
+    # error subclasses it.
+    return isinstance(error, (requests.RequestException, json.JSONDecodeError))
+
+
+def is_invalid_request(error):
+    """Returns True if NewsApiClient rejected a call's arguments.
+
+    These calls never reach NewsAPI, so they say nothing about its health.
+    """
+    return (isinstance(error, (TypeError, ValueError))
+            and not isinstance(error, json.JSONDecodeError))
+
+
+class NewsApiSession(requests.Session):
+
+    def __init__(self, timeout=config.NEWS_API_TIMEOUT):
+        """A requests session with our own timeout and the fast json decoder.
+
+        NewsApiClient hard codes a 30 second timeout, so we override it here.
+
+        Args:
+            timeout: float, seconds to wait for a connection and for the
+                response.
+        """
+        super().__init__()
+        self.timeout = timeout
+        self.hooks["response"].append(_fast_json_hook)
+
+    def request(self, method, url, **kwargs):
+        kwargs["timeout"] = self.timeout
+        return super().request(method, url, **kwargs)
 
 
 class NewsApiHelper(object):
 
-    def __init__(self, api_key=config.NEWS_API_KEY):
-        """Constructor for our API interface."""
-        self.client = NewsApiClient(api_key=api_key)
+    def __init__(self, api_key=config.NEWS_API_KEY,
+                 timeout=config.NEWS_API_TIMEOUT,
+                 retries=config.NEWS_API_RETRIES,
+                 backoff=config.NEWS_API_BACKOFF,
+                 hedge=config.NEWS_API_HEDGE_ENABLED,
+                 breaker=None, response_cache=None):
+        """Constructor for our API interface.
 
-    def get_top_headlines(self, query):
+        Args:
+            api_key: string, the NewsAPI key.
+            timeout: float, seconds to wait on each request.
+            retries: int, the number of times a transient failure is retried.
+            backoff: float, seconds to wait before the first retry. The wait
+                doubles on every retry.
+            hedge: bool, whether to send a duplicate request when the first
+                one is slower than the p95 of recent requests.
+            breaker: A circuit_breaker.CircuitBreaker. Defaults to one using
+                config.NEWS_API_BREAKER_FAILURES/NEWS_API_BREAKER_RESET.
+            response_cache: A cache.JsonFileCache holding the last good
+                response per query and page, used when NewsAPI is
+                unavailable, and the latencies of recent requests.
+                Defaults to config.NEWS_API_RESPONSE_CACHE_FILE.
+        """
+        self.session = NewsApiSession(timeout)
+        self.client = NewsApiClient(api_key=api_key, session=self.session)
+        self.retries = retries
+        self.backoff = backoff
+        self.hedge = hedge
+        self.breaker = breaker if breaker is not None else CircuitBreaker(
+            "newsapi", config.NEWS_API_BREAKER_FAILURES, config.NEWS_API_BREAKER_RESET)
+        self.response_cache = response_cache if response_cache is not None else (
+            JsonFileCache(config.NEWS_API_RESPONSE_CACHE_FILE,
+                          ttl=config.NEWS_API_RESPONSE_CACHE_TTL,
+                          max_entries=config.NEWS_API_RESPONSE_CACHE_ENTRIES))
+
+        self.latencies = collections.deque(
+            self.response_cache.get(LATENCIES_CACHE_KEY, []), maxlen=100)
+        self._executor = ThreadPoolExecutor(max_workers=4) if hedge else None
+
+    def _timed(self, func):
+        start = time.monotonic()
+        result = func()
+        self.latencies.append(time.monotonic() - start)
+        return result
+
+    def hedge_delay(self):
+        """Returns the p95 of recent request latencies, or None if hedging
+        is off or we don't have enough samples yet."""
+        if not self.hedge or len(self.latencies) < config.NEWS_API_HEDGE_MIN_SAMPLES:
+            return None
+        latencies = sorted(self.latencies)
+        return latencies[int(0.95 * (len(latencies) - 1))]
+
+    def _hedged(self, func):
+        """Calls func, sending a duplicate call if the first one is slow.
+
+        Returns the first successful result. If one of the calls fails, the
+        other one's outcome is used.
+        """
+        delay = self.hedge_delay()
+        if delay is None:
+            return self._timed(func)
+
+        primary = self._executor.submit(self._timed, func)
+        done, _ = wait([primary], timeout=delay)
+        if done:
+            return primary.result()
+
+        logging.info(f"NewsAPI slower than {delay:.2f}s, sending a hedged request.")
+        pending = {primary, self._executor.submit(self._timed, func)}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    def _call(self, func):
+        """Calls func through the circuit breaker, retrying transient errors.
+
+        Invalid arguments (e.g. an unknown language in a query) fail straight
+        away and aren't counted against the breaker.
+
+        Raises:
+            CircuitOpenError if the breaker is open, or the last error once
+            the retries are used up.
+        """
+        for attempt in range(self.retries + 1):
+            if not self.breaker.allow_request():
+                raise CircuitOpenError(f"Circuit {self.breaker.name} is open.")
+            try:
+                result = self._hedged(func)
+            except Exception as e:
+                if not is_invalid_request(e):
+                    self.breaker.record_failure()
+                if not is_transient(e) or attempt == self.retries:
+                    raise
+                delay = self.backoff * 2 ** attempt
+                logging.warning(
+                    f"NewsAPI request failed ({e!r}), retrying in {delay:.1f}s...")
+                time.sleep(delay)
+                continue
+            self.breaker.record_success()
+            return result
+
+    def get_top_headlines(self, query, page_size=config.MAX_PAGE_SIZE, page=1):
         """Returns the top headlines.
 
+        Falls back to the last good response for the same query and page if
+        the circuit breaker is open or the request keeps failing. Responses
+        served from the cache have "fromCache" set to True. The page size
+        isn't part of the cache key, since adaptive fetching changes it
+        between runs.
+
         Args:
             query: An instantiated query_helper.QueryHelper object.
+            page_size: int, the number of results per page (max 100).
+            page: int, the page of results to return.
         Returns:
             Top headlines.
         """
         logging.info(f"Retrieveing top headlines for {query}...")
-        articles = self.client.get_top_headlines(
-            q=query.query,
-            language=query.language,
-            country=query.country,
-            category=query.category,
-            sources=",".join(query.sources) if query.sources else None,
-            page_size=100
-        )
+        cache_key = f"{query}|page={page}"
+        try:
+            articles = self._call(lambda: self.client.get_top_headlines(
+                q=query.query,
+                language=query.language,
+                country=query.country,
+                category=query.category,
+                sources=",".join(query.sources) if query.sources else None,
+                page_size=page_size,
+                page=page
+            ))
+        except Exception as e:
+            cached = self.response_cache.get(cache_key)
+            if cached is None or not (
+                    isinstance(e, CircuitOpenError) or is_transient(e)):
+                raise
+            logging.warning(f"NewsAPI unavailable ({e!r}), using cached response.")
+            return dict(cached, fromCache=True)
+
         logging.info(f"Retrieved {len(articles['articles'])} articles")
+        self.response_cache.set(cache_key, articles)
         return articles
+
+    def close(self):
+        """Persists the response cache and latencies, and releases the session."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+        self.response_cache.set(
+            LATENCIES_CACHE_KEY, [round(t, 4) for t in self.latencies])
+        self.response_cache.save()
+        self.session.close()
@@ -0,0 +1,274 @@
+import collections
+import logging
+import queue
+import threading
+
+from newsie import config
+from newsie import serialization
+from newsie.timing import StageTimer
+
+
+# Marks the end of the stream on a queue.
+DONE = object()
+
+
+class Pipeline(object):
+
+    def __init__(self, stages, queue_size=config.PIPELINE_QUEUE_SIZE, timer=None,
+                 name=None):
+        """Runs a chain of stages in threads connected by bounded queues.
+
+        Each stage is a (name, func) pair. func is called with each item from
+        the previous stage and returns an iterable of items for the next one;
+        whatever the last stage returns is discarded. Because every queue
+        holds at most queue_size items, a slow stage makes the stages before
+        it block (backpressure) and the items in flight stay bounded no
+        matter how long the stream is.
+
+        Args:
+            stages: list of (name, func) tuples, in order.
+            queue_size: int, the maximum number of items waiting between two
+                stages.
+            timer: A timing.StageTimer used to time each stage.
+            name: string, if set, stage timings are recorded as
+                "<name>.<stage>" so they don't mix with the timings of code
+                that the stages call into.
+        """
+        self.stages = stages
+        self.queue_size = queue_size
+        self.timer = timer if timer is not None else StageTimer()
+        self.name = name
+
+        self._stop = threading.Event()
+        self._errors = []
+
+    def _timed(self, stage):
+        return self.timer.stage(f"{self.name}.{stage}" if self.name else stage)
+
+    def _put(self, q, item):
+        """Puts item on q, giving up if the pipeline is stopping."""
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, q):
+        """Gets an item from q, returning DONE if the pipeline is stopping."""
+        while not self._stop.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return DONE
+
+    def _fail(self, name, error):
+        logging.error(f"Pipeline stage {name} failed: {error!r}")
+        self._errors.append(error)
+        self._stop.set()
+
+    def _run_source(self, source, out_q):
+        try:
+            items = iter(source)
+            while True:
+                with self._timed("fetch"):
+                    item = next(items, DONE)
+                if not self._put(out_q, item) or item is DONE:
+                    return
+        except Exception as e:
+            self._fail("source", e)
+
+    def _run_stage(self, name, func, in_q, out_q):
+        try:
+            while True:
+                item = self._get(in_q)
+                if item is DONE:
+                    if out_q is not None:
+                        self._put(out_q, DONE)
+                    return
+                with self._timed(name):
+                    results = list(func(item))
+                if out_q is not None:
+                    for result in results:
+                        if not self._put(out_q, result):
+                            return
+        except Exception as e:
+            self._fail(name, e)
+
+    def run(self, source):
+        """Streams every item of source through the stages.
+
+        Args:
+            source: An iterable of items for the first stage. It is consumed
+                lazily on its own thread.
+        Raises:
+            The first exception raised by the source or any stage, after all
+            stages have stopped.
+        """
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in self.stages]
+        threads = [threading.Thread(
+            target=self._run_source, args=(source, queues[0]),
+            name="pipeline-source", daemon=True)]
+        for ind, (name, func) in enumerate(self.stages):
+            out_q = queues[ind + 1] if ind + 1 < len(queues) else None
+            threads.append(threading.Thread(
+                target=self._run_stage, args=(name, func, queues[ind], out_q),
+                name=f"pipeline-{name}", daemon=True))
+
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        if self._errors:
+            raise self._errors[0]
+        logging.info(f"Pipeline stage timings: {self.timer}")
+
+
+def iter_article_batches(news_api_helper, queries, page_size=config.MAX_PAGE_SIZE,
+                         batch_size=config.PIPELINE_BATCH_SIZE):
+    """Lazily fetches pages of articles for each query.
+
+    Pages are only requested when the pipeline has room for them, so just a
+    page is held here at a time. Fetching stops once a query has at least
+    article_limit articles, or there are no more results.
+
+    Args:
+        news_api_helper: An instantiated newsapi_helper.NewsApiHelper.
+        queries: An iterable of query_helper.QueryHelper objects.
+        page_size: int, the number of results per page.
+        batch_size: int, the number of articles per item.
+    Yields:
+        (query, articles) tuples, ending each query with (query, None).
+    """
+    for query in queries:
+        fetched = 0
+        page = 1
+        while fetched < query.article_limit:
+            result = news_api_helper.get_top_headlines(query, page_size=page_size, page=page)
+            articles = result["articles"]
+            for ind in range(0, len(articles), batch_size):
+                yield query, articles[ind:ind + batch_size]
+            fetched += len(articles)
+            if not articles or page * page_size >= result["totalResults"]:
+                break
+            page += 1
+        yield query, None
+
+
+def normalize_stage(item):
+    """Trims articles down to the fields we use."""
+    query, articles = item
+    if articles is not None:
+        articles = [serialization.slim_article(article) for article in articles]
+    yield query, articles
+
+
+class FilterStage(object):
+
+    def __init__(self, dedup_window=config.PIPELINE_DEDUP_WINDOW):
+        """Drops duplicate urls and caps each query at its article_limit.
+
+        Only the last dedup_window urls of a query are remembered, which keeps
+        memory bounded on huge streams at the cost of missing duplicates that
+        are further apart than that.
+
+        Args:
+            dedup_window: int, the number of recent urls remembered.
+        """
+        self.dedup_window = dedup_window
+        self._seen = collections.OrderedDict()
+        self._kept = 0
+
+    def __call__(self, item):
+        query, articles = item
+        if articles is None:
+            self._seen.clear()
+            self._kept = 0
+            yield query, None
+            return
+
+        kept = []
+        for article in articles:
+            if self._kept >= query.article_limit:
+                break
+            if article["url"] in self._seen:
+                continue
+            self._seen[article["url"]] = None
+            if len(self._seen) > self.dedup_window:
+                self._seen.popitem(last=False)
+            kept.append(article)
+            self._kept += 1
+        if kept:
+            yield query, kept
+
+
+class FormatStage(object):
+
+    def __init__(self, slack_helper, n=8):
+        """Groups articles into messages of n and renders their blocks.
+
+        Args:
+            slack_helper: An instantiated slack.SlackFacade.
+            n: int, the number of articles per message.
+        """
+        self.slack_helper = slack_helper
+        self.n = n
+        self._buffer = []
+        self._messages = 0
+
+    def _render(self, query):
+        blocks = self.slack_helper.create_rich_message_layout(
+            query.name, self._buffer, cont=self._messages > 0)
+        self._buffer = []
+        self._messages += 1
+        return query, blocks
+
+    def __call__(self, item):
+        query, articles = item
+        if articles is None:
+            if self._buffer:
+                yield self._render(query)
+            self._messages = 0
+            return
+
+        for article in articles:
+            self._buffer.append(article)
+            if len(self._buffer) == self.n:
+                yield self._render(query)
+
+
+def send_stage(slack_helper):
+    """Returns a stage that posts each rendered message."""
+    def send(item):
+        query, blocks = item
+        slack_helper.emit(blocks, query.slack_channel or slack_helper.default_channel)
+        return ()
+    return send
+
+
+def build_news_pipeline(slack_helper, n=8, queue_size=config.PIPELINE_QUEUE_SIZE,
+                        dedup_window=config.PIPELINE_DEDUP_WINDOW, timer=None):
+    """Builds the fetch -> normalize -> filter -> format -> send pipeline.
+
+    Run it with pipeline.run(iter_article_batches(...)). Stage timings are
+    recorded as "stream.<stage>", apart from the "format" and "emit" timings
+    that a render-only slack_helper records itself.
+
+    Args:
+        slack_helper: An instantiated slack.SlackFacade.
+        n: int, the number of articles per message.
+        queue_size: int, the maximum number of items between two stages.
+        dedup_window: int, the number of recent urls remembered per query.
+        timer: A timing.StageTimer used to time each stage.
+    Returns:
+        A Pipeline.
+    """
+    return Pipeline([
+        ("normalize", normalize_stage),
+        ("filter", FilterStage(dedup_window)),
+        ("format", FormatStage(slack_helper, n)),
+        ("send", send_stage(slack_helper)),
+    ], queue_size=queue_size, timer=timer, name="stream")
@@ -0,0 +1,190 @@
+import argparse
+import collections
+import datetime
+import logging
+import math
+import time
+
+from newsie import config
+from newsie.cache import JsonFileCache
+
+
+FetchPlan = collections.namedtuple(
+    "FetchPlan", ["page_size", "pages", "refresh_interval", "due", "reason"])
+
+
+class QueryStatsStore(object):
+
+    def __init__(self, cache=None, history=config.QUERY_STATS_HISTORY,
+                 seen_limit=config.QUERY_STATS_SEEN_URLS):
+        """Constructs the local store of per-query fetch statistics.
+
+        Args:
+            cache: A cache.JsonFileCache keyed by query name. Defaults to the
+                file set in config.QUERY_STATS_FILE.
+            history: int, the number of runs kept per query.
+            seen_limit: int, the number of article urls remembered per query
+                to tell new articles from ones we've already seen.
+        """
+        self.cache = cache if cache is not None else JsonFileCache(
+            config.QUERY_STATS_FILE)
+        self.history = history
+        self.seen_limit = seen_limit
+
+    def get(self, name):
+        """Returns the stored stats for a query name."""
+        return self.cache.get(name) or {"runs": [], "seen_urls": [], "last_run": None}
+
+    def record(self, name, articles, duplicates, latency, plan=None, now=None):
+        """Records the outcome of fetching a query.
+
+        Args:
+            name: string, the query name.
+            articles: list, the de-duplicated articles that were fetched.
+            duplicates: int, the number of duplicate articles filtered out.
+            latency: float, seconds spent fetching.
+            plan: The FetchPlan used for this fetch, if any.
+            now: float, the current unix time. Defaults to time.time().
+        Returns:
+            The number of articles that hadn't been seen before.
+        """
+        now = time.time() if now is None else now
+        stats = self.get(name)
+        seen = set(stats["seen_urls"])
+        urls = [a["url"] for a in articles]
+        new = sum(1 for url in urls if url not in seen)
+
+        run = {
+            "ts": now,
+            "fetched": len(articles),
+            "new": new,
+            "duplicates": duplicates,
+            "latency": round(latency, 3),
+            # Everything looks new on the first run, so it says nothing
+            # about the query's yield.
+            "baseline": not stats["seen_urls"],
+        }
+        if plan is not None:
+            run.update(page_size=plan.page_size, pages=plan.pages, reason=plan.reason)
+
+        stats["runs"] = (stats["runs"] + [run])[-self.history:]
+        # Keep the most recently seen urls at the end so old ones age out.
+        fetched_urls = set(urls)
+        seen_urls = [url for url in stats["seen_urls"] if url not in fetched_urls]
+        stats["seen_urls"] = (seen_urls + urls)[-self.seen_limit:]
+        stats["last_run"] = now
+        self.cache.set(name, stats)
+        logging.info(
+            f"{name}: fetched {len(articles)} articles, {new} new, "
+            f"{duplicates} duplicates in {latency:.2f}s")
+        return new
+
+    def plan(self, query, now=None):
+        """Decides the page size, page count and refresh interval for a query.
+
+        The page size covers the average number of new articles per run (plus
+        headroom), but never drops below the query's article limit. Queries
+        that keep filling every page get extra pages, unless most of what they
+        fetch are duplicates or their requests are slow. Queries whose share
+        of new articles is below config.ADAPTIVE_LOW_YIELD_RATE are refreshed
+        less often, in proportion to how little they yield.
+
+        Args:
+            query: An instantiated query_helper.QueryHelper object.
+            now: float, the current unix time. Defaults to time.time().
+        Returns:
+            A FetchPlan.
+        """
+        now = time.time() if now is None else now
+        stats = self.get(query.name)
+        runs = [r for r in stats["runs"] if not r.get("baseline")]
+        if not runs:
+            return FetchPlan(config.MAX_PAGE_SIZE, 1, 0, True, "no history")
+
+        fetched = sum(r["fetched"] for r in runs)
+        duplicates = sum(r["duplicates"] for r in runs)
+        avg_new = sum(r["new"] for r in runs) / len(runs)
+        avg_latency = sum(r["latency"] for r in runs) / len(runs)
+        new_rate = sum(r["new"] for r in runs) / fetched if fetched else 0.0
+        duplicate_rate = (duplicates / (fetched + duplicates)
+                          if fetched + duplicates else 0.0)
+        reasons = [
+            f"{avg_new:.1f} new per run",
+            f"{new_rate:.0%} new",
+            f"{duplicate_rate:.0%} duplicates",
+            f"{avg_latency:.2f}s per run",
+        ]
+
+        wanted = math.ceil(avg_new * config.ADAPTIVE_HEADROOM)
+        page_size = min(
+            config.MAX_PAGE_SIZE,
+            max(wanted, query.article_limit, config.ADAPTIVE_MIN_PAGE_SIZE)
+        )
+        pages = min(config.ADAPTIVE_MAX_PAGES,
+                    max(1, math.ceil(wanted / config.MAX_PAGE_SIZE)))
+        if pages > 1 and duplicate_rate >= config.ADAPTIVE_MAX_DUPLICATE_RATE:
+            pages = 1
+            reasons.append("no extra pages: mostly duplicates")
+        elif pages > 1 and avg_latency >= config.ADAPTIVE_MAX_LATENCY:
+            pages = 1
+            reasons.append("no extra pages: slow responses")
+
+        if new_rate < config.ADAPTIVE_LOW_YIELD_RATE:
+            shortfall = 1 - new_rate / config.ADAPTIVE_LOW_YIELD_RATE
+            interval = round(config.ADAPTIVE_MAX_REFRESH_INTERVAL * shortfall)
+            reasons.append(f"low yield: refresh every {interval / 3600:.1f}h")
+        else:
+            interval = 0
+        reason = ", ".join(reasons)
+
+        due = stats["last_run"] is None or now - stats["last_run"] >= interval
+        return FetchPlan(page_size, pages, interval, due, reason)
+
+    def save(self):
+        self.cache.save()
+
+
+def format_report(store, queries, now=None):
+    """Returns a plain text report of query stats and fetch decisions.
+
+    Args:
+        store: A QueryStatsStore.
+        queries: An iterable of query_helper.QueryHelper objects.
+        now: float, the current unix time. Defaults to time.time().
+    """
+    lines = []
+    for query in queries:
+        stats = store.get(query.name)
+        runs = stats["runs"]
+        plan = store.plan(query, now=now)
+        lines.append(f"{query.name}")
+        if runs:
+            n = len(runs)
+            last_run = datetime.datetime.fromtimestamp(stats["last_run"])
+            lines.append(
+                f"  runs: {n}  last run: {last_run:%Y-%m-%d %H:%M:%S}\n"
+                f"  avg fetched: {sum(r['fetched'] for r in runs) / n:.1f}  "
+                f"avg new: {sum(r['new'] for r in runs) / n:.1f}  "
+                f"avg duplicates: {sum(r['duplicates'] for r in runs) / n:.1f}  "
+                f"avg latency: {sum(r['latency'] for r in runs) / n:.2f}s"
+            )
+        else:
+            lines.append("  runs: 0")
+        lines.append(
+            f"  plan: page_size={plan.page_size} pages={plan.pages} "
+            f"refresh_interval={plan.refresh_interval}s "
+            f"due={'yes' if plan.due else 'no'} ({plan.reason})"
+        )
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Show per-query fetch statistics and budget decisions.")
+    parser.add_argument(
+        "--stats-file", default=config.QUERY_STATS_FILE,
+        help="The query stats file to read.")
+    args = parser.parse_args()
+
+    print(format_report(
+        QueryStatsStore(cache=JsonFileCache(args.stats_file)), config.QUERIES))
@@ -0,0 +1,101 @@
+import json
+import logging
+
+from newsie import serialization
+from newsie.slack import SlackFacade
+from newsie.timing import StageTimer
+
+
+class RenderOnlySlackFacade(SlackFacade):
+
+    def __init__(self, output, timer=None, image_probe=None):
+        """Slack facade that writes payloads out instead of posting them.
+
+        Every message send_messages would post is written to output as one
+        json line: {"channel": ..., "text": ..., "blocks": [...]}.
+
+        Args:
+            output: A writable text file object (e.g. sys.stdout).
+            timer: A timing.StageTimer used to time the format and emit stages.
+            image_probe: Optional image_probe.ImageProbe, as for SlackFacade.
+        """
+        # Always "post" so every payload is rendered.
+        super().__init__(token=None, image_probe=image_probe, update_mode="post")
+        self.output = output
+        self.timer = timer if timer is not None else StageTimer()
+
+        self.article_count = 0
+        self.message_count = 0
+        self.payload_bytes = 0
+        self.max_payload_bytes = 0
+
+    def emit(self, blocks, channel, ts=None, thread_ts=None):
+        """Writes the message payload to output.
+
+        Returns:
+            A dict shaped like the parts of a chat_postMessage response we use.
+        """
+        with self.timer.stage("emit"):
+            line = serialization.dumps({
+                "channel": channel,
+                "text": "Newsie Incoming!",
+                "blocks": blocks,
+            })
+            self.output.write(line + "\n")
+
+        size = len(line.encode("utf-8"))
+        self.message_count += 1
+        self.payload_bytes += size
+        self.max_payload_bytes = max(self.max_payload_bytes, size)
+        return {"ok": True, "channel": channel, "ts": str(self.message_count)}
+
+    def create_rich_message_layout(self, name, articles, cont=False):
+        self.article_count += len(articles)
+        with self.timer.stage("format"):
+            return super().create_rich_message_layout(name, articles, cont)
+
+    def report(self):
+        """Returns a dict with counts, payload sizes and stage timings."""
+        return {
+            "articles": self.article_count,
+            "messages": self.message_count,
+            "payload_bytes": self.payload_bytes,
+            "max_payload_bytes": self.max_payload_bytes,
+            "mean_payload_bytes": (
+                round(self.payload_bytes / self.message_count)
+                if self.message_count else 0
+            ),
+            "timings": self.timer.summary(),
+        }
+
+
+class OfflineNewsApiHelper(object):
+
+    def __init__(self, path):
+        """Serves NewsAPI responses from a json file instead of the API.
+
+        The file holds either a single top headlines response, used for every
+        query, or an object mapping query names to responses.
+
+        Args:
+            path: string, path to the json file.
+        """
+        with open(path) as f:
+            self.responses = json.load(f)
+
+    def get_top_headlines(self, query, page_size=100, page=1):
+        """Returns the requested page of the stored response for query."""
+        if "articles" in self.responses:
+            response = self.responses
+        else:
+            response = self.responses.get(
+                query.name, {"totalResults": 0, "articles": []})
+
+        start = (page - 1) * page_size
+        articles = response["articles"][start:start + page_size]
+        logging.info(f"Loaded {len(articles)} offline articles for {query}")
+        return {
+            "status": "ok",
+            "totalResults": response.get("totalResults", len(response["articles"])),
+            "articles": articles,
+        }
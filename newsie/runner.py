@@ -1,10 +1,23 @@
+import argparse
+import json
 import logging
+import sys
+import time
 
 from newsie import config
+from newsie.enrichment import ArticleEnricher
+from newsie.image_probe import ImageProbe
 from newsie.newsapi_helper import NewsApiHelper
+from newsie.pipeline import build_news_pipeline, iter_article_batches
+from newsie.query_stats import QueryStatsStore
+from newsie.render import OfflineNewsApiHelper, RenderOnlySlackFacade
 from newsie.slack import SlackFacade
+from newsie.timing import StageTimer
 
 
+STREAM_UPDATE_MODE_ERROR_TEXT = (
+    "--stream only posts new digests; set SLACK_UPDATE_MODE to 'post' to use it.")
+
 # Set up logging.
 logging.basicConfig(
     filename=config.LOGFILE,
@@ -14,21 +27,159 @@ logging.basicConfig(
 )
 
 
-def main(news_api_helper, slack_helper):
+def fetch_articles(news_api_helper, query, page_size=config.MAX_PAGE_SIZE, pages=1):
+    """Fetches up to `pages` pages of top headlines for a query.
+
+    Args:
+        news_api_helper: An instantiated newsapi_helper.NewsApiHelper.
+        query: An instantiated query_helper.QueryHelper object.
+        page_size: int, the number of results per page.
+        pages: int, the maximum number of pages to fetch.
+    Returns:
+        Tuple of (articles, duplicates, from_cache) where duplicates is the
+        number of articles dropped because their url was already fetched and
+        from_cache is True if any page was a cached fallback response.
+    """
+    articles = []
+    urls = set()
+    duplicates = 0
+    from_cache = False
+    for page in range(1, pages + 1):
+        result = news_api_helper.get_top_headlines(query, page_size=page_size, page=page)
+        logging.info(f"Retrieved {result['totalResults']} results.")
+        from_cache = from_cache or result.get("fromCache", False)
+        for article in result["articles"]:
+            if article["url"] in urls:
+                duplicates += 1
+                continue
+            urls.add(article["url"])
+            articles.append(article)
+
+        if page * page_size >= result["totalResults"]:
+            break
+
+    return articles, duplicates, from_cache
+
+
+def main(news_api_helper, slack_helper, enricher=None, query_stats=None,
+         timer=None):
+    timer = timer if timer is not None else StageTimer()
 
     for query in config.QUERIES:
+        plan = None
+        page_size, pages = config.MAX_PAGE_SIZE, 1
+        if query_stats is not None:
+            plan = query_stats.plan(query)
+            logging.info(f"Fetch plan for {query.name}: {plan}")
+            if not plan.due:
+                logging.info(f"Skipping {query.name}, not due for a refresh.")
+                continue
+            page_size, pages = plan.page_size, plan.pages
+
         # get results
-        result = news_api_helper.get_top_headlines(query)
-        logging.info(f"Retrieved {result['totalResults']} results.")
-        articles = result["articles"][:query.article_limit]
+        start = time.monotonic()
+        with timer.stage("fetch"):
+            articles, duplicates, from_cache = fetch_articles(
+                news_api_helper, query, page_size, pages)
+        # A cached response says nothing new about the query's yield or
+        # latency, so it would only skew the stats.
+        if query_stats is not None and not from_cache:
+            query_stats.record(
+                query.name, articles, duplicates, time.monotonic() - start, plan)
+        articles = articles[:query.article_limit]
+
+        if enricher is not None:
+            with timer.stage("enrich"):
+                articles = enricher.enrich(articles)
+
+        # Probe images in the background; verdicts apply to later posts.
+        if slack_helper.image_probe is not None:
+            slack_helper.image_probe.submit(a["urlToImage"] for a in articles)
 
         # send to slack
-        slack_helper.send_messages(
-            query.name,
-            articles,
-            query.slack_channel
-        )
+        with timer.stage("send"):
+            slack_helper.send_messages(
+                query.name,
+                articles,
+                query.slack_channel
+            )
+
+    if query_stats is not None:
+        query_stats.save()
+    logging.info(f"Stage timings: {timer}")
+
+
+def stream(news_api_helper, slack_helper, timer=None):
+    """Sends every query's articles through the bounded streaming pipeline.
+
+    Unlike main, no query's articles are ever held in memory all at once.
+    Enrichment, adaptive fetching and digest updates aren't applied.
+
+    Raises:
+        ValueError if slack_helper would update or thread digests rather
+        than post them, since streaming can't do either.
+    """
+    if slack_helper.update_mode != "post":
+        raise ValueError(STREAM_UPDATE_MODE_ERROR_TEXT)
+    pipeline = build_news_pipeline(slack_helper, timer=timer)
+    pipeline.run(iter_article_batches(news_api_helper, config.QUERIES))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Send news articles to Slack.")
+    parser.add_argument(
+        "--render-only", metavar="PATH",
+        help="Don't post to Slack; write every payload as a json line to PATH "
+             "('-' for stdout) and print a report to stderr.")
+    parser.add_argument(
+        "--stream", action="store_true",
+        help="Stream articles through a bounded pipeline to keep memory flat.")
+    parser.add_argument(
+        "--articles-file", metavar="PATH",
+        help="Read NewsAPI responses from a json file instead of the API.")
+    args = parser.parse_args(argv)
+    # Render-only runs always post, so they can stream in any update mode.
+    if args.stream and not args.render_only and config.SLACK_UPDATE_MODE != "post":
+        parser.error(STREAM_UPDATE_MODE_ERROR_TEXT)
+    return args
+
+
+def render_only(args, news_api_helper, enricher=None, image_probe=None):
+    """Runs main without posting to Slack and prints a report to stderr."""
+    timer = StageTimer()
+    output = sys.stdout if args.render_only == "-" else open(args.render_only, "w")
+    try:
+        slack_helper = RenderOnlySlackFacade(
+            output, timer=timer, image_probe=image_probe)
+        if args.stream:
+            stream(news_api_helper, slack_helper, timer=timer)
+        else:
+            main(news_api_helper, slack_helper, enricher, timer=timer)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    print(json.dumps(slack_helper.report(), indent=2), file=sys.stderr)
 
 
 if __name__ == "__main__":
-    main(NewsApiHelper(), SlackFacade())
\ No newline at end of file
+    args = parse_args()
+    news_api_helper = (
+        OfflineNewsApiHelper(args.articles_file) if args.articles_file
+        else NewsApiHelper()
+    )
+    enricher = ArticleEnricher() if config.ENRICHMENT_ENABLED else None
+    image_probe = ImageProbe() if config.IMAGE_PROBE_ENABLED else None
+    try:
+        if args.render_only:
+            render_only(args, news_api_helper, enricher, image_probe)
+        elif args.stream:
+            stream(news_api_helper, SlackFacade(image_probe=image_probe))
+        else:
+            query_stats = QueryStatsStore() if config.ADAPTIVE_FETCH_ENABLED else None
+            main(news_api_helper, SlackFacade(image_probe=image_probe), enricher,
+                 query_stats)
+    finally:
+        if image_probe is not None:
+            image_probe.close()
+        if isinstance(news_api_helper, NewsApiHelper):
+            news_api_helper.close()
\ No newline at end of file
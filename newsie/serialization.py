@@ -0,0 +1,59 @@
+import json
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depends on the environment
+    orjson = None
+
+
+# The article fields Newsie actually reads. Trimming the rest (author,
+# content, ...) saves memory but costs CPU, so only consumers that hold large
+# batches of articles do it.
+ARTICLE_FIELDS = ("title", "description", "url", "urlToImage", "publishedAt")
+
+
+def loads(data):
+    """Decodes json bytes or str, using orjson when it's installed."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dumps(obj):
+    """Encodes obj as a compact json str, using orjson when it's installed."""
+    if orjson is not None:
+        return orjson.dumps(obj).decode("utf-8")
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False)
+
+
+def encode_blocks(blocks):
+    """Returns Slack blocks ready to hand to the sdk.
+
+    With orjson, the blocks are pre-encoded, which is much cheaper than
+    letting the sdk walk the nested dicts. Without it, pre-encoding only makes
+    the sdk encode the resulting string a second time, so the list is
+    returned as is.
+    """
+    if orjson is not None:
+        return dumps(blocks)
+    return blocks
+
+
+def slim_article(article):
+    """Returns a copy of a NewsAPI article with only the fields we use."""
+    slim = {field: article.get(field) for field in ARTICLE_FIELDS}
+    slim["source"] = {"name": (article.get("source") or {}).get("name")}
+    return slim
+
+
+def slim_response(payload):
+    """Drops the unused article fields from a decoded NewsAPI response.
+
+    Args:
+        payload: dict, a decoded NewsAPI response.
+    Returns:
+        The same dict with its articles replaced by slim copies.
+    """
+    if "articles" in payload:
+        payload["articles"] = [slim_article(a) for a in payload["articles"]]
+    return payload
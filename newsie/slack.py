@@ -1,5 +1,8 @@
+import difflib
+import hashlib
 import logging
 import datetime
+import time
 
 import dateutil.parser
 import pytz
@@ -7,6 +10,8 @@ from slack_sdk import WebClient
 from slack_sdk.errors import SlackApiError
 
 from newsie import config
+from newsie import serialization
+from newsie.cache import JsonFileCache
 
 
 SLACK_BOT_TEXT = (
@@ -21,21 +26,99 @@ PLACEHOLDER_IMAGE = (
     "=format&fit=crop&w=3150&q=8"
 )
 
+UPDATE_MODES = ("post", "update", "thread")
+UPDATE_MODE_ERROR_TEXT = f"update_mode must be one of: {', '.join(UPDATE_MODES)}"
+
+# Slack errors meaning a remembered message can no longer be edited or
+# replied to, usually because someone deleted it.
+MISSING_MESSAGE_ERRORS = frozenset(
+    ["message_not_found", "cant_update_message", "thread_not_found"])
+
+
+def blocks_digest(blocks):
+    """Returns a short fingerprint of a message's blocks."""
+    return hashlib.sha1(serialization.dumps(blocks).encode("utf-8")).hexdigest()
+
+
+def diff_messages(previous_urls, urls, n=8):
+    """Assigns the current articles to messages so that few messages change.
+
+    The previous and current urls are aligned with difflib. Articles that are
+    still there stay in the message they were posted in, removed articles are
+    dropped from theirs, and new articles fill up the last remaining message
+    before going into new messages of up to n articles.
+
+    Args:
+        previous_urls: list of url lists, one per posted message.
+        urls: list of the current article urls, in order.
+        n: int, the maximum number of articles per message.
+    Returns:
+        A list of index lists into urls, one per message. The first
+        len(previous_urls) entries line up with the posted messages (an empty
+        list means the message should be deleted); any extra entries are new
+        messages.
+    """
+    owners = [ind for ind, message in enumerate(previous_urls) for _ in message]
+    previous_flat = [url for message in previous_urls for url in message]
+    matcher = difflib.SequenceMatcher(None, previous_flat, urls, autojunk=False)
+
+    messages = [[] for _ in previous_urls]
+    new = []
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            for offset in range(i2 - i1):
+                messages[owners[i1 + offset]].append(j1 + offset)
+        else:
+            new.extend(range(j1, j2))
+
+    kept = [message for message in messages if message]
+    if kept and new:
+        room = max(0, n - len(kept[-1]))
+        kept[-1].extend(new[:room])
+        new = new[room:]
+    messages.extend(new[i:i + n] for i in range(0, len(new), n))
+    return messages
+
 
 class SlackFacade(object):
 
     def __init__(self, token=config.SLACK_BOT_TOKEN,
-                 bot_name=config.SLACK_BOT_NAME):
+                 bot_name=config.SLACK_BOT_NAME, image_probe=None,
+                 update_mode=config.SLACK_UPDATE_MODE, message_store=None):
+        """Constructs the Slack facade.
+
+        Args:
+            token: string, the Slack bot token.
+            bot_name: string, the name messages are posted under.
+            image_probe: Optional image_probe.ImageProbe used to skip
+                known-bad images.
+            update_mode: string, one of UPDATE_MODES. "post" posts every
+                digest as new messages, "update" edits the previous digest for
+                the same query and channel in place and "thread" replies to
+                it with only the new articles.
+            message_store: A cache.JsonFileCache remembering posted digests.
+                Defaults to config.SLACK_MESSAGE_STORE_FILE.
+        Raises:
+            ValueError if update_mode is unknown.
+        """
+        if update_mode not in UPDATE_MODES:
+            raise ValueError(UPDATE_MODE_ERROR_TEXT)
+
         self.token = token
         self.default_channel = config.DEFAULT_SLACK_CHANNEL
         self.bot_name = bot_name
+        self.image_probe = image_probe
+        self.update_mode = update_mode
+        if message_store is None and update_mode != "post":
+            message_store = JsonFileCache(config.SLACK_MESSAGE_STORE_FILE)
+        self.message_store = message_store
 
         # Internally set properites
         self.client = WebClient(token=self.token)
         self.icon_emoji = ":newspaper:"
         self.slack_message_entries = {}
 
-    def emit(self, blocks, channel):
+    def emit(self, blocks, channel, ts=None, thread_ts=None):
         """Sends a message to your channel.
 
         Args:
@@ -44,23 +127,55 @@ class SlackFacade(object):
                 this object should be used to construct the Rich Message Blocks.
                 See the Slack kit builder for more information on block
                 construction: https://app.slack.com/block-kit-builder
-            channel: string, The channel to send the message to.
+            channel: string, The channel to send the message to. Updates need
+                the channel id rather than its name.
+            ts: string, if set, the message with this timestamp is updated
+                instead of posting a new one.
+            thread_ts: string, if set, the message is posted as a reply in
+                this message's thread.
         """
+        encoded_blocks = serialization.encode_blocks(blocks)
         try:
-            response = self.client.chat_postMessage(
-                channel=channel,
-                text="Newsie Incoming!",
-                blocks=blocks,
-                # as_user must be false to set bot name
-                username=self.bot_name,
-                icon_emoji=self.icon_emoji
-            )
+            if ts is not None:
+                response = self.client.chat_update(
+                    channel=channel,
+                    ts=ts,
+                    text="Newsie Incoming!",
+                    blocks=encoded_blocks
+                )
+            else:
+                kwargs = {"thread_ts": thread_ts} if thread_ts else {}
+                response = self.client.chat_postMessage(
+                    channel=channel,
+                    text="Newsie Incoming!",
+                    blocks=encoded_blocks,
+                    # as_user must be false to set bot name
+                    username=self.bot_name,
+                    icon_emoji=self.icon_emoji,
+                    **kwargs
+                )
         except SlackApiError as e:
             logging.error(f"Slack encountered an error: {e.response['error']}")
             raise e
 
         return response
 
+    def delete(self, channel, ts):
+        """Deletes a message. Messages that are already gone are ignored.
+
+        Args:
+            channel: string, the channel id of the message.
+            ts: string, the timestamp of the message.
+        """
+        try:
+            return self.client.chat_delete(channel=channel, ts=ts)
+        except SlackApiError as e:
+            if e.response["error"] in MISSING_MESSAGE_ERRORS:
+                logging.warning(f"Message {ts} was already deleted.")
+                return None
+            logging.error(f"Slack encountered an error: {e.response['error']}")
+            raise e
+
     def _chunk_message_data(self, articles, n=8):
         """Prepares the data objects for use by x.
 
@@ -100,6 +215,10 @@ class SlackFacade(object):
         final_articles = self._chunk_message_data(articles, n=n)
         message_count = len(final_articles)
 
+        if self.update_mode != "post":
+            self._sync_digest(name, final_articles, channel, n)
+            return
+
         logging.info(f"Sending listings via Slack in {message_count} messages.")
 
         # Send message block sets
@@ -111,6 +230,123 @@ class SlackFacade(object):
             slack_response = self.emit(message, channel)
             logging.info(f"Sent message {ind+1}/{message_count} to Slack:\n{slack_response}")
 
+    def _message_record(self, response, articles, blocks):
+        return {
+            "ts": response["ts"],
+            "urls": [article["url"] for article in articles],
+            "digest": blocks_digest(blocks),
+        }
+
+    def _sync_digest(self, name, chunks, channel, n):
+        """Brings the digest for (name, channel) up to date with few calls.
+
+        The first digest is posted as usual and remembered. Later digests
+        either edit the remembered messages in place ("update") or reply in
+        the first message's thread with only the new articles ("thread").
+        Digests older than config.SLACK_DIGEST_MAX_AGE are started afresh.
+        Remembered messages that were deleted in Slack are posted again.
+
+        Args:
+            name: string, name of this search.
+            chunks: list of article lists, one per message.
+            channel: string, the channel for these messages.
+            n: int, the number of articles per message.
+        """
+        key = f"{name}|{channel}"
+        previous = self.message_store.get(key)
+        # A digest without messages has nothing to edit or reply to, and
+        # its channel_id is still the channel name rather than its id.
+        if previous and (not previous["messages"] or
+                         time.time() - previous["created"] > config.SLACK_DIGEST_MAX_AGE):
+            previous = None
+
+        if previous is None:
+            digest = self._post_digest(name, chunks, channel)
+        elif self.update_mode == "update":
+            digest = self._update_digest(name, chunks, previous, n)
+        else:
+            digest = self._thread_digest(name, chunks, previous, channel, n)
+
+        self.message_store.set(key, digest)
+        self.message_store.save()
+
+    def _post_digest(self, name, chunks, channel):
+        digest = {"created": time.time(), "channel_id": channel,
+                  "messages": [], "seen_urls": []}
+        for ind, articles in enumerate(chunks):
+            blocks = self.create_rich_message_layout(name, articles, cont=ind > 0)
+            response = self.emit(blocks, channel)
+            digest["channel_id"] = response["channel"]
+            digest["messages"].append(self._message_record(response, articles, blocks))
+            digest["seen_urls"].extend(article["url"] for article in articles)
+        logging.info(f"Posted {len(chunks)} new messages for {name}.")
+        return digest
+
+    def _update_digest(self, name, chunks, previous, n):
+        channel_id = previous["channel_id"]
+        articles = [article for chunk in chunks for article in chunk]
+        assignment = diff_messages(
+            [m["urls"] for m in previous["messages"]],
+            [article["url"] for article in articles],
+            n=n
+        )
+        messages = []
+        edits = 0
+        for ind, indices in enumerate(assignment):
+            posted = previous["messages"][ind] if ind < len(previous["messages"]) else None
+            if not indices:
+                self.delete(channel_id, posted["ts"])
+                edits += 1
+                continue
+            message_articles = [articles[i] for i in indices]
+            blocks = self.create_rich_message_layout(
+                name, message_articles, cont=bool(messages))
+            if posted is not None and posted["digest"] == blocks_digest(blocks):
+                messages.append(posted)
+                continue
+            response = self._update_or_post(blocks, channel_id, posted)
+            channel_id = response["channel"]
+            messages.append(self._message_record(response, message_articles, blocks))
+            edits += 1
+
+        logging.info(f"Applied {edits} edits to the digest for {name}.")
+        seen_urls = [article["url"] for article in articles]
+        return dict(previous, channel_id=channel_id, messages=messages,
+                    seen_urls=seen_urls)
+
+    def _update_or_post(self, blocks, channel_id, posted):
+        """Updates a posted message, or posts a new one if it's gone."""
+        if posted is None:
+            return self.emit(blocks, channel_id)
+        try:
+            return self.emit(blocks, channel_id, ts=posted["ts"])
+        except SlackApiError as e:
+            if e.response["error"] not in MISSING_MESSAGE_ERRORS:
+                raise
+            logging.warning(f"Message {posted['ts']} can't be updated, posting it again.")
+            return self.emit(blocks, channel_id)
+
+    def _thread_digest(self, name, chunks, previous, channel, n):
+        seen = set(previous["seen_urls"])
+        new_articles = [
+            article for articles in chunks for article in articles
+            if article["url"] not in seen
+        ]
+        parent_ts = previous["messages"][0]["ts"] if previous["messages"] else None
+        for ind, articles in enumerate(self._chunk_message_data(new_articles, n=n)):
+            blocks = self.create_rich_message_layout(name, articles, cont=True)
+            try:
+                self.emit(blocks, previous["channel_id"], thread_ts=parent_ts)
+            except SlackApiError as e:
+                if ind > 0 or e.response["error"] not in MISSING_MESSAGE_ERRORS:
+                    raise
+                logging.warning(f"Digest thread for {name} is gone, posting it afresh.")
+                return self._post_digest(name, chunks, channel)
+
+        logging.info(f"Replied with {len(new_articles)} new articles for {name}.")
+        seen_urls = previous["seen_urls"] + [article["url"] for article in new_articles]
+        return dict(previous, seen_urls=seen_urls)
+
     def format_divider_block(self):
         """Returns a divider block."""
         return {"type": "divider"}
@@ -170,7 +406,8 @@ class SlackFacade(object):
         """
         tzone = pytz.timezone(config.TIMEZONE)
         tz_dt = publish_dt.replace(tzinfo=pytz.utc).astimezone(tzone)
-        image_url = PLACEHOLDER_IMAGE if not image_url else image_url
+        if not image_url or (self.image_probe and self.image_probe.is_bad(image_url)):
+            image_url = PLACEHOLDER_IMAGE
         dt_string = tz_dt.strftime("%Y-%m-%d %H:%M:%S")
         # dt_string = tzone.normalize(tz_dt).strftime("%Y-%m-%d %H:%M:%S")
         return {
@@ -212,7 +449,8 @@ class SlackFacade(object):
 
         for article in articles:
             headline = article["title"]
-            description = article["description"]
+            # Prefer the extractive summary if the article was enriched.
+            description = article.get("summary") or article["description"]
             url = article["url"]
             image_url = article["urlToImage"]
             source = article["source"]["name"]
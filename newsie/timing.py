@@ -0,0 +1,32 @@
+import collections
+import contextlib
+import time
+
+
+class StageTimer(object):
+
+    def __init__(self):
+        """Accumulates wall clock time and call counts per named stage."""
+        self.seconds = collections.defaultdict(float)
+        self.calls = collections.defaultdict(int)
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """Context manager that adds the time spent in the block to name."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[name] += time.perf_counter() - start
+            self.calls[name] += 1
+
+    def summary(self):
+        """Returns a dict of stage name to {"seconds", "calls"}."""
+        return {
+            name: {"seconds": round(self.seconds[name], 6), "calls": self.calls[name]}
+            for name in self.seconds
+        }
+
+    def __str__(self):
+        return ", ".join(
+            f"{name}={seconds:.3f}s" for name, seconds in self.seconds.items())
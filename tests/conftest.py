@@ -0,0 +1,71 @@
+import threading
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+
+def pytest_addoption(parser):
+    parser.addoption(
+        "--runslow", action="store_true", default=False,
+        help="Also run tests marked as slow.")
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "slow: a long running test, skipped by default")
+
+
+def pytest_collection_modifyitems(config, items):
+    if config.getoption("--runslow"):
+        return
+    skip_slow = pytest.mark.skip(reason="slow, run with --runslow")
+    for item in items:
+        if "slow" in item.keywords:
+            item.add_marker(skip_slow)
+
+
+def make_article(n=0, **fields):
+    """Returns a NewsAPI article, with any of its fields overridden."""
+    article = {
+        "source": {"id": None, "name": "source"},
+        "author": "author",
+        "title": f"Title {n}",
+        "description": "description",
+        "url": f"www.{n}.com",
+        "urlToImage": "www.image.com",
+        "publishedAt": "2021-03-01T01:01:01Z",
+        "content": "content"
+    }
+    article.update(fields)
+    return article
+
+
+def make_articles(start, stop, **fields):
+    return [make_article(n, **fields) for n in range(start, stop)]
+
+
+@pytest.fixture
+def local_server():
+    """Factory fixture starting a local http server for a handler class.
+
+    The server gets a lock, a base_url and any extra attributes passed in,
+    which handlers can use to record requests. Servers are shut down after
+    the test.
+    """
+    servers = []
+
+    def start(handler_class, **attrs):
+        server = ThreadingHTTPServer(("127.0.0.1", 0), handler_class)
+        server.lock = threading.Lock()
+        server.base_url = f"http://127.0.0.1:{server.server_address[1]}"
+        for name, value in attrs.items():
+            setattr(server, name, value)
+        # Clients that time out close the connection mid-response; ignore that.
+        server.handle_error = lambda request, client_address: None
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
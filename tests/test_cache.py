@@ -0,0 +1,60 @@
+from newsie import cache
+
+
+class TestJsonFileCache:
+
+    def test_get_returns_default_when_missing(self):
+        """Tests that missing keys return the default."""
+        c = cache.JsonFileCache(None)
+        assert c.get("missing") is None
+        assert c.get("missing", 1) == 1
+        assert "missing" not in c
+
+    def test_set_and_save_persist_to_disk(self, tmp_path):
+        """Tests that saved entries are reloaded by a new cache."""
+        path = str(tmp_path / "cache.json")
+        c = cache.JsonFileCache(path)
+        c.set("key", {"value": 1})
+        c.save()
+
+        assert cache.JsonFileCache(path).get("key") == {"value": 1}
+
+    def test_expired_entries_are_ignored(self, mocker):
+        """Tests that entries older than the ttl are treated as missing."""
+        mocker.patch.object(cache.time, "time", return_value=100)
+        c = cache.JsonFileCache(None, ttl=10)
+        c.set("key", True)
+
+        cache.time.time.return_value = 105
+        assert c.get("key") is True
+
+        cache.time.time.return_value = 111
+        assert c.get("key") is None
+
+    def test_unreadable_file_starts_empty(self, tmp_path):
+        """Tests that a corrupt cache file doesn't break loading."""
+        path = tmp_path / "cache.json"
+        path.write_text("not json")
+        assert len(cache.JsonFileCache(str(path))) == 0
+
+    def test_entry_ttl_overrides_cache_ttl(self, mocker):
+        """Tests that a per entry ttl takes precedence over the cache ttl."""
+        mocker.patch.object(cache.time, "time", return_value=100)
+        c = cache.JsonFileCache(None, ttl=1000)
+        c.set("short", True, ttl=10)
+        c.set("long", True)
+
+        cache.time.time.return_value = 111
+        assert c.get("short") is None
+        assert c.get("long") is True
+
+    def test_max_entries_evicts_least_recently_set(self):
+        """Tests that the oldest entries are dropped past max_entries."""
+        c = cache.JsonFileCache(None, max_entries=2)
+        c.set("a", 1)
+        c.set("b", 2)
+        c.set("a", 3)
+        c.set("c", 4)
+
+        assert "b" not in c
+        assert c.get("a") == 3 and c.get("c") == 4
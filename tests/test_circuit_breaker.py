@@ -0,0 +1,48 @@
+import pytest
+
+from newsie import circuit_breaker
+
+
+def fail():
+    raise RuntimeError("boom")
+
+
+class TestCircuitBreaker:
+
+    def test_opens_after_threshold(self):
+        """Tests that consecutive failures open the circuit."""
+        breaker = circuit_breaker.CircuitBreaker("test", failure_threshold=2)
+        for _ in range(2):
+            with pytest.raises(RuntimeError):
+                breaker.call(fail)
+
+        assert breaker.state == circuit_breaker.OPEN
+        with pytest.raises(circuit_breaker.CircuitOpenError):
+            breaker.call(lambda: "never called")
+
+    def test_success_resets_failures(self):
+        """Tests that a success resets the consecutive failure count."""
+        breaker = circuit_breaker.CircuitBreaker("test", failure_threshold=2)
+        with pytest.raises(RuntimeError):
+            breaker.call(fail)
+        assert breaker.call(lambda: "ok") == "ok"
+        with pytest.raises(RuntimeError):
+            breaker.call(fail)
+
+        assert breaker.state == circuit_breaker.CLOSED
+
+    def test_half_open_allows_single_trial(self, mocker):
+        """Tests that only one trial call goes through after the timeout."""
+        mocker.patch.object(circuit_breaker.time, "monotonic", return_value=0)
+        breaker = circuit_breaker.CircuitBreaker(
+            "test", failure_threshold=1, reset_timeout=10)
+        breaker.record_failure()
+        assert not breaker.allow_request()
+
+        circuit_breaker.time.monotonic.return_value = 11
+        assert breaker.state == circuit_breaker.HALF_OPEN
+        assert breaker.allow_request()
+        assert not breaker.allow_request()
+
+        breaker.record_success()
+        assert breaker.state == circuit_breaker.CLOSED
@@ -0,0 +1,204 @@
+import time
+from http.server import BaseHTTPRequestHandler
+
+import pytest
+
+from newsie import enrichment
+from newsie.cache import JsonFileCache
+from tests.conftest import make_article
+
+
+ARTICLE_HTML = """
+<html>
+<head>
+    <meta property="og:image" content="https://img.example.com/og.jpg">
+    <meta property="og:description" content="The full og description.">
+</head>
+<body>
+    <p>Markets rallied on Monday as tech stocks climbed.</p>
+    <p>Analysts said tech stocks led the markets higher. The weather was mild.</p>
+    <p>Tech stocks and markets are expected to stay volatile.</p>
+</body>
+</html>
+"""
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.hits[self.path] = server.hits.get(self.path, 0) + 1
+            server.active += 1
+            server.max_active = max(server.max_active, server.active)
+        try:
+            if self.path.startswith("/slow"):
+                time.sleep(0.3)
+            if self.path.startswith("/missing"):
+                self.send_response(404)
+                self.end_headers()
+                return
+            html = ARTICLE_HTML
+            if self.path.startswith("/relative"):
+                html = html.replace("https://img.example.com/og.jpg", "/img/a.jpg")
+            body = html.encode("utf-8")
+            charset = "bogus-cs" if self.path.startswith("/bogus") else "utf-8"
+            self.send_response(200)
+            self.send_header("Content-Type", f"text/html; charset={charset}")
+            if self.path.startswith("/incomplete"):
+                # A broken chunked body makes the client raise IncompleteRead.
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                self.wfile.write(b"not-a-chunk-size\r\n")
+                return
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        finally:
+            with server.lock:
+                server.active -= 1
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def fixture_server(local_server):
+    return local_server(FixtureHandler, hits={}, active=0, max_active=0)
+
+
+def make_page_article(url, image=None, description="Truncated desc…"):
+    return make_article(url=url, urlToImage=image, description=description)
+
+
+class TestEnrichment:
+
+    def test_parser_extracts_opengraph_and_text(self):
+        """Tests that the parser picks up og metadata and paragraphs."""
+        parser = enrichment.PageMetadataParser()
+        parser.feed(ARTICLE_HTML)
+        assert parser.image == "https://img.example.com/og.jpg"
+        assert parser.description == "The full og description."
+        assert len(parser.paragraphs) == 3
+
+    def test_is_truncated_detects_markers(self):
+        """Tests that newsapi truncation markers are detected."""
+        assert enrichment.is_truncated(None)
+        assert enrichment.is_truncated("Some text…")
+        assert enrichment.is_truncated("Some text [+1234 chars]")
+        assert not enrichment.is_truncated("Some full text.")
+
+    def test_summarize_keeps_top_sentences_in_order(self):
+        """Tests that the summary keeps the most representative sentences."""
+        text = (
+            "Tech stocks rallied. The weather was mild. "
+            "Analysts expect tech stocks to keep rallying."
+        )
+        assert enrichment.summarize(text, 2) == (
+            "Tech stocks rallied. Analysts expect tech stocks to keep rallying."
+        )
+
+    def test_enrich_fills_missing_fields(self, fixture_server):
+        """Tests that missing images and truncated descriptions are filled."""
+        enricher = enrichment.ArticleEnricher(cache=JsonFileCache(None))
+        article = make_page_article(f"{fixture_server.base_url}/a")
+
+        enriched = enricher.enrich([article])[0]
+
+        assert enriched["urlToImage"] == "https://img.example.com/og.jpg"
+        assert enriched["description"] == "The full og description."
+        assert enriched["summary"]
+        assert article["urlToImage"] is None
+
+    def test_enrich_keeps_existing_fields(self, fixture_server):
+        """Tests that existing images and full descriptions are kept."""
+        enricher = enrichment.ArticleEnricher(cache=JsonFileCache(None))
+        article = make_page_article(
+            f"{fixture_server.base_url}/a", image="https://mine.jpg",
+            description="A complete description.")
+
+        enriched = enricher.enrich([article])[0]
+
+        assert enriched["urlToImage"] == "https://mine.jpg"
+        assert enriched["description"] == "A complete description."
+
+    def test_enrich_uses_persistent_cache(self, fixture_server, tmp_path):
+        """Tests that cached urls aren't fetched again, even across runs."""
+        path = str(tmp_path / "cache.json")
+        url = f"{fixture_server.base_url}/cached"
+
+        enrichment.ArticleEnricher(cache=JsonFileCache(path)).enrich(
+            [make_page_article(url)])
+        enriched = enrichment.ArticleEnricher(cache=JsonFileCache(path)).enrich(
+            [make_page_article(url)])[0]
+
+        assert fixture_server.hits["/cached"] == 1
+        assert enriched["urlToImage"] == "https://img.example.com/og.jpg"
+
+    def test_enrich_respects_per_host_limit(self, fixture_server):
+        """Tests that concurrent connections to a host are bounded."""
+        enricher = enrichment.ArticleEnricher(
+            cache=JsonFileCache(None), max_workers=8, per_host_limit=2)
+        articles = [
+            make_page_article(f"{fixture_server.base_url}/slow{i}") for i in range(6)
+        ]
+
+        enricher.enrich(articles)
+
+        assert fixture_server.max_active == 2
+
+    def test_enrich_leaves_article_on_failure(self, fixture_server):
+        """Tests that failed and timed out fetches leave articles untouched."""
+        enricher = enrichment.ArticleEnricher(
+            cache=JsonFileCache(None), timeout=0.1)
+        articles = [
+            make_page_article(f"{fixture_server.base_url}/missing"),
+            make_page_article(f"{fixture_server.base_url}/slow"),
+        ]
+
+        assert enricher.enrich(articles) == articles
+        assert len(enricher.cache) == 0
+
+    def test_enrich_falls_back_to_utf8_for_unknown_charset(self, fixture_server):
+        """Tests that a page declaring an unknown charset is still parsed."""
+        enricher = enrichment.ArticleEnricher(cache=JsonFileCache(None))
+
+        enriched = enricher.enrich(
+            [make_page_article(f"{fixture_server.base_url}/bogus")])[0]
+
+        assert enriched["urlToImage"] == "https://img.example.com/og.jpg"
+
+    def test_enrich_survives_incomplete_response(self, fixture_server):
+        """Tests that a truncated response leaves the article untouched."""
+        enricher = enrichment.ArticleEnricher(cache=JsonFileCache(None))
+        articles = [make_page_article(f"{fixture_server.base_url}/incomplete")]
+
+        assert enricher.enrich(articles) == articles
+
+    def test_enrich_resolves_relative_images(self, fixture_server):
+        """Tests that a relative og:image is resolved against the page url."""
+        enricher = enrichment.ArticleEnricher(cache=JsonFileCache(None))
+
+        enriched = enricher.enrich(
+            [make_page_article(f"{fixture_server.base_url}/relative/page")])[0]
+
+        assert enriched["urlToImage"] == f"{fixture_server.base_url}/img/a.jpg"
+
+    def test_default_cache_is_bounded(self, mocker):
+        """Tests that the default cache expires and caps its entries."""
+        mocker.patch.object(enrichment.config, "ENRICHMENT_CACHE_FILE", None)
+        enricher = enrichment.ArticleEnricher()
+
+        assert enricher.cache.ttl == enrichment.config.ENRICHMENT_CACHE_TTL
+        assert enricher.cache.max_entries == enrichment.config.ENRICHMENT_CACHE_ENTRIES
+
+    def test_enrich_skips_non_http_urls(self, tmp_path, mocker):
+        """Tests that file:// and other non-http urls are never opened."""
+        secret = tmp_path / "secret.html"
+        secret.write_text(ARTICLE_HTML)
+        urlopen = mocker.spy(enrichment.urllib.request, "urlopen")
+        enricher = enrichment.ArticleEnricher(cache=JsonFileCache(None))
+        articles = [make_page_article(f"file://{secret}")]
+
+        assert enricher.enrich(articles) == articles
+        urlopen.assert_not_called()
@@ -0,0 +1,118 @@
+import time
+from http.server import BaseHTTPRequestHandler
+
+import pytest
+
+from newsie import image_probe
+from newsie.cache import JsonFileCache
+
+
+class ImageHandler(BaseHTTPRequestHandler):
+
+    def do_HEAD(self):
+        with self.server.lock:
+            self.server.hits.append(self.path)
+        if self.path.startswith("/slow"):
+            time.sleep(0.3)
+        if self.path.startswith("/missing"):
+            self.send_response(404)
+        elif self.path.startswith("/nohead"):
+            self.send_response(405)
+        else:
+            self.send_response(200)
+            content_type = "text/html" if self.path.startswith("/page") else "image/jpeg"
+            self.send_header("Content-Type", content_type)
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def image_server(local_server):
+    return local_server(ImageHandler, hits=[])
+
+
+class TestImageProbe:
+
+    def test_probe_records_verdicts(self, image_server):
+        """Tests that probes cache good, bad and unknown images correctly."""
+        probe = image_probe.ImageProbe(cache=JsonFileCache(None))
+        base = image_server.base_url
+        probe.submit([f"{base}/ok.jpg", f"{base}/missing.jpg",
+                      f"{base}/page", f"{base}/nohead.jpg", None])
+        probe.close()
+
+        assert probe.cache.get(f"{base}/ok.jpg") is True
+        assert probe.is_bad(f"{base}/missing.jpg")
+        assert probe.is_bad(f"{base}/page")
+        assert f"{base}/nohead.jpg" not in probe.cache
+        assert not probe.is_bad(None)
+
+    def test_submit_does_not_block(self, image_server):
+        """Tests that submitting slow probes returns immediately."""
+        probe = image_probe.ImageProbe(cache=JsonFileCache(None))
+        url = f"{image_server.base_url}/slow.jpg"
+
+        start = time.monotonic()
+        probe.submit([url])
+        assert time.monotonic() - start < 0.1
+        assert not probe.is_bad(url)
+
+        probe.close()
+        assert probe.cache.get(url) is True
+
+    def test_cached_urls_are_not_probed_again(self, image_server):
+        """Tests that urls with a cached verdict skip the probe."""
+        cache = JsonFileCache(None)
+        url = f"{image_server.base_url}/missing.jpg"
+        cache.set(url, False)
+        probe = image_probe.ImageProbe(cache=cache)
+
+        probe.submit([url])
+        probe.close()
+
+        assert image_server.hits == []
+        assert probe.is_bad(url)
+
+    def test_host_breaker_skips_failing_host(self, image_server):
+        """Tests that a host that keeps timing out stops being probed."""
+        probe = image_probe.ImageProbe(
+            cache=JsonFileCache(None), timeout=0.05, max_workers=1,
+            host_failure_threshold=2)
+        urls = [f"{image_server.base_url}/slow{i}.jpg" for i in range(5)]
+
+        probe.submit(urls)
+        probe.close()
+
+        assert len(image_server.hits) == 2
+        assert all(probe.is_bad(url) for url in urls)
+
+    def test_skipped_and_failed_urls_are_not_cached_for_long(self, image_server, mocker):
+        """Tests that breaker skips aren't cached and failures expire quickly."""
+        probe = image_probe.ImageProbe(
+            cache=JsonFileCache(None, ttl=1000), timeout=0.05, max_workers=1,
+            host_failure_threshold=1, host_reset_timeout=10)
+        urls = [f"{image_server.base_url}/slow{i}.jpg" for i in range(3)]
+
+        probe.submit(urls)
+        probe.close()
+
+        assert len(image_server.hits) == 1
+        assert urls[0] in probe.cache
+        assert urls[1] not in probe.cache and urls[2] not in probe.cache
+        assert all(probe.is_bad(url) for url in urls)
+
+        mocker.patch("newsie.cache.time.time", return_value=time.time() + 11)
+        assert urls[0] not in probe.cache
+
+    def test_non_http_urls_are_bad_without_opening_them(self, mocker, tmp_path):
+        """Tests that file:// and other non-http urls are never opened."""
+        image = tmp_path / "image.jpg"
+        image.write_bytes(b"jpeg")
+        urlopen = mocker.spy(image_probe.urllib.request, "urlopen")
+        probe = image_probe.ImageProbe(cache=JsonFileCache(None))
+
+        assert probe.check(f"file://{image}") is False
+        urlopen.assert_not_called()
+        probe.close()
@@ -1,6 +1,66 @@
+import json
+import time
+from http.server import BaseHTTPRequestHandler
+
+import pytest
+import requests
+from newsapi import const
+from newsapi.newsapi_exception import NewsAPIException
 
 from newsie import query_helper
 from newsie import newsapi_helper
+from newsie.cache import JsonFileCache
+from newsie.circuit_breaker import CLOSED, CircuitBreaker
+from tests.conftest import make_article
+
+
+OK_RESPONSE = {
+    "status": "ok",
+    "totalResults": 1,
+    "articles": [make_article(url="www.com")]
+}
+
+FAULTS = {
+    "ok": (200, OK_RESPONSE),
+    "error": (500, {"status": "error", "code": "unexpectedError", "message": "boom"}),
+    "bad_key": (401, {"status": "error", "code": "apiKeyInvalid", "message": "bad"}),
+}
+
+
+class FaultHandler(BaseHTTPRequestHandler):
+    """Serves the scripted faults in order, then "ok" forever."""
+
+    def do_GET(self):
+        with self.server.lock:
+            self.server.hits += 1
+            fault = self.server.script.pop(0) if self.server.script else "ok"
+        if fault == "slow":
+            time.sleep(1)
+            fault = "ok"
+        status, body = FAULTS[fault]
+        body = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub(local_server, mocker):
+    server = local_server(FaultHandler, hits=0, script=[])
+    mocker.patch.object(
+        const, "TOP_HEADLINES_URL", f"{server.base_url}/v2/top-headlines")
+    return server
+
+
+def make_helper(**kwargs):
+    kwargs.setdefault("backoff", 0)
+    kwargs.setdefault("response_cache", JsonFileCache(None))
+    return newsapi_helper.NewsApiHelper("FAKEKEY", **kwargs)
 
 
 class TestNewsApiHelper:
@@ -11,8 +71,9 @@ class TestNewsApiHelper:
             newsapi_helper, "NewsApiClient", autospec=True
         )
         fkey = "TEST"
-        _ = newsapi_helper.NewsApiHelper(fkey)
-        newsapi_helper.NewsApiClient.assert_called_once_with(fkey)
+        helper = newsapi_helper.NewsApiHelper(fkey)
+        newsapi_helper.NewsApiClient.assert_called_once_with(
+            fkey, session=helper.session)
 
     def test_top_headline_getter_calls_client_with_args(self, mocker):
         """Tests that we call the NewsApiClient wtih expected args."""
@@ -35,5 +96,138 @@ class TestNewsApiHelper:
             country=q.country,
             category=q.category,
             sources=None,
-            page_size=100
+            page_size=100,
+            page=1
         )
+
+    def test_session_decodes_with_fast_path(self, mocker):
+        """Tests that responses are decoded through serialization.loads."""
+        mocker.patch.object(newsapi_helper.serialization, "loads", return_value={})
+        response = mocker.Mock(content=b"{}")
+
+        newsapi_helper._fast_json_hook(response)
+
+        assert response.json() == {}
+        newsapi_helper.serialization.loads.assert_called_once_with(b"{}")
+
+    def test_transient_errors_are_retried(self, stub):
+        """Tests that upstream errors are retried until one succeeds."""
+        stub.script = ["error", "error"]
+        helper = make_helper(retries=2)
+
+        result = helper.get_top_headlines(query_helper.QueryHelper(name="q"))
+
+        assert result["articles"][0]["url"] == "www.com"
+        assert stub.hits == 3
+
+    def test_permanent_errors_are_not_retried(self, stub):
+        """Tests that errors like a bad api key fail straight away."""
+        stub.script = ["bad_key"]
+        helper = make_helper(retries=2)
+
+        with pytest.raises(NewsAPIException):
+            helper.get_top_headlines(query_helper.QueryHelper(name="q"))
+        assert stub.hits == 1
+
+    def test_invalid_query_is_not_retried_or_counted(self, stub):
+        """Tests that a bad query config fails fast and leaves the breaker closed."""
+        breaker = CircuitBreaker("test", failure_threshold=1)
+        helper = make_helper(retries=2, breaker=breaker)
+
+        with pytest.raises(ValueError, match="invalid language"):
+            helper.get_top_headlines(query_helper.QueryHelper(name="q", language="xx"))
+        assert stub.hits == 0
+        assert breaker.state == CLOSED
+
+    def test_requests_time_out(self, stub):
+        """Tests that our timeout replaces the client's 30 second default."""
+        stub.script = ["slow"]
+        helper = make_helper(timeout=0.1, retries=0)
+
+        start = time.monotonic()
+        with pytest.raises(requests.Timeout):
+            helper.get_top_headlines(query_helper.QueryHelper(name="q"))
+        assert time.monotonic() - start < 0.5
+
+    def test_open_breaker_uses_cached_response(self, stub):
+        """Tests that the last good response is served while the breaker is open."""
+        helper = make_helper(
+            retries=1, breaker=CircuitBreaker("test", failure_threshold=2))
+        query = query_helper.QueryHelper(name="q")
+        expected = helper.get_top_headlines(query)
+
+        stub.script = ["error"] * 10
+        assert helper.get_top_headlines(query) == dict(expected, fromCache=True)
+        hits = stub.hits
+        assert helper.get_top_headlines(query) == dict(expected, fromCache=True)
+        assert stub.hits == hits
+
+    def test_cached_response_ignores_page_size(self, stub):
+        """Tests that the fallback still hits after the page size changes."""
+        helper = make_helper(
+            retries=0, breaker=CircuitBreaker("test", failure_threshold=1))
+        query = query_helper.QueryHelper(name="q")
+        expected = helper.get_top_headlines(query, page_size=100)
+
+        stub.script = ["error"] * 10
+        assert helper.get_top_headlines(query, page_size=20) == dict(
+            expected, fromCache=True)
+
+    def test_open_breaker_without_cache_raises(self, stub):
+        """Tests that we fail fast when there's nothing cached to fall back on."""
+        stub.script = ["error"] * 10
+        helper = make_helper(
+            retries=0, breaker=CircuitBreaker("test", failure_threshold=1))
+        query = query_helper.QueryHelper(name="q")
+
+        with pytest.raises(NewsAPIException):
+            helper.get_top_headlines(query)
+        with pytest.raises(newsapi_helper.CircuitOpenError):
+            helper.get_top_headlines(query)
+        assert stub.hits == 1
+
+    def test_slow_request_is_hedged(self, stub, mocker):
+        """Tests that a duplicate request is sent after the p95 delay."""
+        mocker.patch.object(newsapi_helper.config, "NEWS_API_HEDGE_MIN_SAMPLES", 5)
+        stub.script = ["slow"]
+        helper = make_helper(hedge=True, timeout=2)
+        helper.latencies.extend([0.05] * 5)
+
+        start = time.monotonic()
+        result = helper.get_top_headlines(query_helper.QueryHelper(name="q"))
+
+        assert time.monotonic() - start < 0.8
+        assert result["totalResults"] == 1
+        assert stub.hits == 2
+        helper.close()
+
+    def test_latencies_persist_across_runs(self, stub, mocker, tmp_path):
+        """Tests that hedging uses latencies recorded by earlier runs."""
+        mocker.patch.object(newsapi_helper.config, "NEWS_API_HEDGE_MIN_SAMPLES", 5)
+        path = str(tmp_path / "cache.json")
+        query = query_helper.QueryHelper(name="q")
+        for _ in range(5):
+            helper = make_helper(response_cache=JsonFileCache(path))
+            helper.get_top_headlines(query)
+            helper.close()
+
+        stub.script = ["slow"]
+        helper = make_helper(
+            hedge=True, timeout=2, response_cache=JsonFileCache(path))
+        start = time.monotonic()
+        helper.get_top_headlines(query)
+
+        assert time.monotonic() - start < 0.8
+        assert stub.hits == 7
+        helper.close()
+
+    def test_hedge_delay_is_p95_of_latencies(self, mocker):
+        """Tests the hedge delay calculation."""
+        mocker.patch.object(newsapi_helper.config, "NEWS_API_HEDGE_MIN_SAMPLES", 20)
+        helper = make_helper(hedge=True)
+        helper.latencies.extend(range(19))
+        assert helper.hedge_delay() is None
+
+        helper.latencies.extend(range(19, 101))
+        assert helper.hedge_delay() == 95
+        assert make_helper(hedge=False).hedge_delay() is None
@@ -0,0 +1,153 @@
+import io
+import os
+import threading
+import time
+
+import pytest
+
+from newsie import pipeline
+from newsie import query_helper
+from newsie import render
+from newsie.timing import StageTimer
+from tests.conftest import make_article
+
+
+class SyntheticNewsApiHelper(object):
+    """Generates pages of distinct articles on demand."""
+
+    def __init__(self, total):
+        self.total = total
+
+    def get_top_headlines(self, query, page_size=100, page=1):
+        start = (page - 1) * page_size
+        stop = min(start + page_size, self.total)
+        return {
+            "totalResults": self.total,
+            "articles": [make_article(n) for n in range(start, stop)]
+        }
+
+
+class NullOutput(object):
+
+    def write(self, line):
+        pass
+
+
+def rss_bytes():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+class TestPipeline:
+
+    def test_stream_matches_send_messages(self):
+        """Tests that streaming renders the same payloads as send_messages."""
+        query = query_helper.QueryHelper(name="test", slack_channel="#c", article_limit=20)
+        articles = SyntheticNewsApiHelper(20).get_top_headlines(query)["articles"]
+        expected = io.StringIO()
+        render.RenderOnlySlackFacade(expected).send_messages(
+            query.name, articles, query.slack_channel)
+
+        output = io.StringIO()
+        timer = StageTimer()
+        slack_helper = render.RenderOnlySlackFacade(output, timer=timer)
+        pipeline.build_news_pipeline(slack_helper, timer=timer).run(
+            pipeline.iter_article_batches(
+                SyntheticNewsApiHelper(20), [query], page_size=7, batch_size=3))
+
+        assert output.getvalue() == expected.getvalue()
+        timings = slack_helper.report()["timings"]
+        assert timings["format"]["calls"] == timings["emit"]["calls"] == 3
+        assert timings["stream.send"]["calls"] == 3
+        assert set(timings) == {
+            "format", "emit", "stream.fetch", "stream.normalize",
+            "stream.filter", "stream.format", "stream.send"}
+
+    def test_filter_drops_duplicates_and_caps_articles(self):
+        """Tests that repeated urls are dropped and the limit is respected."""
+        query = query_helper.QueryHelper(name="test", article_limit=3)
+        stage = pipeline.FilterStage()
+        batch = [{"url": u} for u in ["a", "b", "a", "c", "d"]]
+
+        assert list(stage((query, batch))) == [
+            (query, [{"url": "a"}, {"url": "b"}, {"url": "c"}])]
+        assert list(stage((query, None))) == [(query, None)]
+        assert list(stage((query, [{"url": "a"}]))) == [(query, [{"url": "a"}])]
+
+    def test_filter_dedup_window_is_bounded(self):
+        """Tests that only the most recent urls are remembered."""
+        query = query_helper.QueryHelper(name="test", article_limit=100)
+        stage = pipeline.FilterStage(dedup_window=2)
+        list(stage((query, [{"url": u} for u in ["a", "b", "c"]])))
+
+        assert list(stage((query, [{"url": "a"}, {"url": "c"}]))) == [
+            (query, [{"url": "a"}])]
+
+    def test_slow_stage_applies_backpressure(self):
+        """Tests that the source can't run far ahead of a slow stage."""
+        produced = []
+        consumed = []
+        lead = []
+
+        def source():
+            for n in range(50):
+                produced.append(n)
+                lead.append(len(produced) - len(consumed))
+                yield n
+
+        def slow(item):
+            time.sleep(0.002)
+            consumed.append(item)
+            return ()
+
+        pipeline.Pipeline([("pass", lambda item: [item]), ("slow", slow)],
+                          queue_size=2).run(source())
+
+        assert len(consumed) == 50
+        # Two queues of 2, plus one item held by each of the two stages.
+        assert max(lead) <= 2 * 2 + 2 + 1
+
+    def test_stage_errors_stop_the_pipeline(self):
+        """Tests that a failing stage stops everything and is re-raised."""
+        def fail(item):
+            if item == 3:
+                raise RuntimeError("boom")
+            return [item]
+
+        def endless():
+            n = 0
+            while True:
+                yield n
+                n += 1
+
+        with pytest.raises(RuntimeError, match="boom"):
+            pipeline.Pipeline([("fail", fail), ("sink", lambda item: ())],
+                              queue_size=2).run(endless())
+        assert not [t for t in threading.enumerate() if t.name.startswith("pipeline-")]
+
+    @pytest.mark.slow
+    @pytest.mark.skipif(not os.path.exists("/proc/self/statm"),
+                        reason="needs /proc to read the resident set size")
+    def test_memory_stays_flat_over_a_million_articles(self):
+        """Tests that RSS doesn't grow with the number of streamed articles."""
+        total = 1000000
+        query = query_helper.QueryHelper(name="test", article_limit=total)
+        slack_helper = render.RenderOnlySlackFacade(NullOutput())
+        samples = []
+
+        def sample_rss(blocks, channel, ts=None, thread_ts=None):
+            if slack_helper.message_count % 5000 == 0:
+                samples.append(rss_bytes())
+            slack_helper.message_count += 1
+            return {}
+
+        slack_helper.emit = sample_rss
+        pipeline.build_news_pipeline(
+            slack_helper, queue_size=4, dedup_window=10000).run(
+            pipeline.iter_article_batches(
+                SyntheticNewsApiHelper(total), [query]))
+
+        assert slack_helper.article_count == total
+        # Ignore the first samples while the dedup window and caches fill up.
+        steady = samples[len(samples) // 5:]
+        assert max(steady) - min(steady) < 10 * 1024 * 1024
@@ -0,0 +1,113 @@
+from newsie import config
+from newsie import query_helper
+from newsie import query_stats
+from newsie.cache import JsonFileCache
+from tests.conftest import make_articles
+
+
+def make_store():
+    return query_stats.QueryStatsStore(cache=JsonFileCache(None))
+
+
+class TestQueryStats:
+
+    query = query_helper.QueryHelper(name="test", query="q", article_limit=16)
+
+    def test_record_counts_new_articles(self):
+        """Tests that only unseen urls are counted as new."""
+        store = make_store()
+        assert store.record("test", make_articles(0, 10), 0, 1.0) == 10
+        assert store.record("test", make_articles(5, 15), 2, 1.0) == 5
+
+        runs = store.get("test")["runs"]
+        assert runs[0]["baseline"] and not runs[1]["baseline"]
+        assert runs[1]["duplicates"] == 2
+
+    def test_record_bounds_history_and_seen_urls(self):
+        """Tests that run history and seen urls are bounded."""
+        store = query_stats.QueryStatsStore(
+            cache=JsonFileCache(None), history=2, seen_limit=5)
+        for n in range(3):
+            store.record("test", make_articles(n * 10, n * 10 + 10), 0, 1.0)
+
+        stats = store.get("test")
+        assert len(stats["runs"]) == 2
+        assert stats["seen_urls"] == [a["url"] for a in make_articles(25, 30)]
+
+    def test_plan_defaults_without_history(self):
+        """Tests that a query without usable history gets the full budget."""
+        store = make_store()
+        store.record("test", make_articles(0, 100), 0, 1.0)
+
+        plan = store.plan(self.query)
+        assert plan.page_size == config.MAX_PAGE_SIZE
+        assert plan.pages == 1 and plan.due
+
+    def test_plan_shrinks_page_size_for_low_yield(self):
+        """Tests that a query yielding few new articles gets a small page."""
+        store = make_store()
+        store.record("test", make_articles(0, 20), 0, 1.0, now=0)
+        store.record("test", make_articles(2, 22), 0, 1.0, now=10)
+
+        plan = store.plan(self.query, now=20)
+        assert plan.page_size == self.query.article_limit
+        assert plan.pages == 1
+        assert plan.refresh_interval == 0 and plan.due
+
+    def test_plan_adds_pages_for_high_yield(self):
+        """Tests that a query that keeps filling pages gets more of them."""
+        store = make_store()
+        store.record("test", make_articles(0, 100), 0, 1.0, now=0)
+        store.record("test", make_articles(100, 200), 0, 1.0, now=10)
+
+        plan = store.plan(self.query, now=20)
+        assert plan.page_size == config.MAX_PAGE_SIZE
+        assert plan.pages == 2
+
+    def test_plan_backs_off_when_nothing_is_new(self):
+        """Tests that stale queries are refreshed less often."""
+        store = make_store()
+        store.record("test", make_articles(0, 20), 0, 1.0, now=0)
+        store.record("test", make_articles(0, 20), 0, 1.0, now=10)
+
+        plan = store.plan(self.query, now=20)
+        assert plan.refresh_interval == config.ADAPTIVE_MAX_REFRESH_INTERVAL
+        assert not plan.due
+        assert store.plan(
+            self.query, now=10 + config.ADAPTIVE_MAX_REFRESH_INTERVAL).due
+
+    def test_plan_skips_extra_pages_for_duplicates_or_slow_runs(self):
+        """Tests that extra pages aren't fetched when they don't pay off."""
+        for duplicates, latency, note in [(200, 1.0, "mostly duplicates"),
+                                          (0, 9.0, "slow responses")]:
+            store = make_store()
+            store.record("test", make_articles(0, 100), 0, 1.0, now=0)
+            store.record(
+                "test", make_articles(100, 200), duplicates, latency, now=10)
+
+            plan = store.plan(self.query, now=20)
+            assert plan.pages == 1
+            assert f"no extra pages: {note}" in plan.reason
+
+    def test_plan_scales_refresh_interval_with_yield(self):
+        """Tests that the refresh interval grows as the yield drops."""
+        store = make_store()
+        store.record("test", make_articles(0, 100), 0, 1.0, now=0)
+        store.record("test", make_articles(5, 105), 0, 1.0, now=10)
+
+        plan = store.plan(self.query, now=20)
+        assert plan.refresh_interval == config.ADAPTIVE_MAX_REFRESH_INTERVAL // 2
+        assert "5% new" in plan.reason
+        assert "low yield: refresh every 12.0h" in plan.reason
+
+    def test_format_report_includes_stats_and_plan(self):
+        """Tests that the report shows the stats and the resulting plan."""
+        store = make_store()
+        store.record("test", make_articles(0, 20), 4, 0.5, now=0)
+        store.record("test", make_articles(2, 22), 0, 1.5, now=10)
+
+        report = query_stats.format_report(store, [self.query], now=20)
+        assert "runs: 2" in report
+        assert "avg duplicates: 2.0" in report
+        assert "avg latency: 1.00s" in report
+        assert "plan: page_size=16 pages=1" in report
@@ -0,0 +1,93 @@
+import io
+import json
+
+from newsie import config
+from newsie import query_helper
+from newsie import render
+from newsie import runner
+from tests.conftest import make_articles
+
+
+def make_response(n):
+    return {"status": "ok", "totalResults": n, "articles": make_articles(0, n)}
+
+
+class TestRender:
+
+    def test_emit_writes_json_lines(self):
+        """Tests that each message is written as one json line."""
+        output = io.StringIO()
+        helper = render.RenderOnlySlackFacade(output)
+        articles = make_articles(0, 10)
+
+        helper.send_messages("test", articles, "#chan", n=8)
+
+        lines = [json.loads(line) for line in output.getvalue().splitlines()]
+        assert len(lines) == 2
+        assert lines[0]["channel"] == "#chan"
+        assert lines[0]["blocks"] == helper.create_rich_message_layout(
+            "test", articles[:8])
+        assert lines[1]["blocks"] == helper.create_rich_message_layout(
+            "test", articles[8:], cont=True)
+
+    def test_report_counts_messages_and_sizes(self):
+        """Tests that the report reflects what was written."""
+        output = io.StringIO()
+        helper = render.RenderOnlySlackFacade(output)
+
+        helper.send_messages("test", make_articles(0, 10), "#chan")
+        report = helper.report()
+
+        assert report["articles"] == 10
+        assert report["messages"] == 2
+        assert report["payload_bytes"] == len(output.getvalue().encode()) - 2
+        assert report["max_payload_bytes"] >= report["mean_payload_bytes"]
+        assert report["timings"]["format"]["calls"] == 2
+        assert report["timings"]["emit"]["calls"] == 2
+
+    def test_offline_helper_pages_through_response(self, tmp_path):
+        """Tests that the offline helper serves pages of a stored response."""
+        path = tmp_path / "articles.json"
+        path.write_text(json.dumps(make_response(5)))
+        helper = render.OfflineNewsApiHelper(str(path))
+        query = query_helper.QueryHelper(name="test")
+
+        result = helper.get_top_headlines(query, page_size=2, page=3)
+
+        assert result["totalResults"] == 5
+        assert [a["url"] for a in result["articles"]] == ["www.4.com"]
+
+    def test_offline_helper_maps_query_names(self, tmp_path):
+        """Tests that responses can be given per query name."""
+        path = tmp_path / "articles.json"
+        path.write_text(json.dumps({"a": make_response(2)}))
+        helper = render.OfflineNewsApiHelper(str(path))
+
+        assert len(helper.get_top_headlines(
+            query_helper.QueryHelper(name="a"))["articles"]) == 2
+        assert helper.get_top_headlines(
+            query_helper.QueryHelper(name="b"))["articles"] == []
+
+    def test_render_only_runs_main_end_to_end(self, mocker, tmp_path, capsys):
+        """Tests that the runner renders every query without posting."""
+        mocker.patch.object(config, "QUERIES", [
+            query_helper.QueryHelper(name="a", article_limit=10),
+            query_helper.QueryHelper(name="b", slack_channel="#b"),
+        ])
+        articles_path = tmp_path / "articles.json"
+        articles_path.write_text(json.dumps(make_response(20)))
+        output_path = tmp_path / "payloads.jsonl"
+        args = runner.parse_args([
+            "--render-only", str(output_path),
+            "--articles-file", str(articles_path)
+        ])
+
+        runner.render_only(args, render.OfflineNewsApiHelper(args.articles_file))
+
+        lines = [json.loads(line) for line in output_path.read_text().splitlines()]
+        assert [line["channel"] for line in lines] == [
+            config.DEFAULT_SLACK_CHANNEL, config.DEFAULT_SLACK_CHANNEL, "#b", "#b"]
+        report = json.loads(capsys.readouterr().err)
+        assert report["articles"] == 26
+        assert report["messages"] == 4
+        assert set(report["timings"]) == {"fetch", "send", "format", "emit"}
@@ -0,0 +1,71 @@
+import pytest
+
+from newsie import config
+from newsie import query_helper
+from newsie import runner
+from tests.conftest import make_article
+
+
+def make_result(urls, total):
+    return {
+        "totalResults": total,
+        "articles": [make_article(url=url) for url in urls],
+    }
+
+
+class TestRunner:
+
+    query = query_helper.QueryHelper(name="test", query="q")
+
+    def test_fetch_articles_merges_pages_and_drops_duplicates(self, mocker):
+        """Tests that pages are merged and repeated urls are filtered."""
+        helper = mocker.Mock()
+        helper.get_top_headlines.side_effect = [
+            make_result(["a", "b"], 4),
+            make_result(["b", "c"], 4),
+        ]
+
+        articles, duplicates, from_cache = runner.fetch_articles(
+            helper, self.query, page_size=2, pages=3)
+
+        assert [a["url"] for a in articles] == ["a", "b", "c"]
+        assert duplicates == 1
+        assert not from_cache
+        helper.get_top_headlines.assert_called_with(self.query, page_size=2, page=2)
+
+    def test_fetch_articles_stops_at_last_page(self, mocker):
+        """Tests that we don't request pages past the total results."""
+        helper = mocker.Mock()
+        helper.get_top_headlines.return_value = make_result(["a"], 1)
+
+        articles, _, _ = runner.fetch_articles(helper, self.query, pages=3)
+
+        assert len(articles) == 1
+        assert helper.get_top_headlines.call_count == 1
+
+    def test_stream_rejects_digest_updates(self, mocker):
+        """Tests that streaming refuses to run when digests should be updated."""
+        slack_helper = mocker.Mock(update_mode="update")
+        with pytest.raises(ValueError, match="SLACK_UPDATE_MODE"):
+            runner.stream(mocker.Mock(), slack_helper)
+
+        mocker.patch.object(config, "SLACK_UPDATE_MODE", "thread")
+        with pytest.raises(SystemExit):
+            runner.parse_args(["--stream"])
+        assert runner.parse_args(["--stream", "--render-only", "-"]).stream
+
+    def test_main_skips_stats_for_cached_responses(self, mocker):
+        """Tests that fallback responses aren't recorded as runs."""
+        mocker.patch.object(config, "QUERIES", [self.query])
+        helper = mocker.Mock()
+        helper.get_top_headlines.return_value = dict(
+            make_result(["a"], 1), fromCache=True)
+        query_stats = mocker.Mock()
+        query_stats.plan.return_value.due = True
+        query_stats.plan.return_value.pages = 1
+        query_stats.plan.return_value.page_size = 10
+
+        runner.main(helper, mocker.Mock(image_probe=None), query_stats=query_stats)
+
+        query_stats.record.assert_not_called()
+        query_stats.save.assert_called_once()
@@ -0,0 +1,70 @@
+import json
+
+import pytest
+
+from newsie import serialization
+
+
+PAYLOAD = {
+    "status": "ok",
+    "totalResults": 1,
+    "articles": [{
+        "source": {"id": "src", "name": "Source"},
+        "author": "Author",
+        "title": "Title ü",
+        "description": "description",
+        "url": "www.com",
+        "urlToImage": None,
+        "publishedAt": "2021-03-01T01:01:01Z",
+        "content": "A long body [+1234 chars]"
+    }]
+}
+
+
+@pytest.fixture(params=["fast", "stdlib"])
+def backend(request, mocker):
+    if request.param == "stdlib":
+        mocker.patch.object(serialization, "orjson", None)
+    elif serialization.orjson is None:
+        pytest.skip("orjson is not installed")
+    return request.param
+
+
+class TestSerialization:
+
+    def test_round_trip(self, backend):
+        """Tests that both backends decode what they encode."""
+        encoded = serialization.dumps(PAYLOAD)
+        assert isinstance(encoded, str)
+        assert serialization.loads(encoded) == PAYLOAD
+        assert serialization.loads(encoded.encode("utf-8")) == PAYLOAD
+
+    def test_encode_blocks_only_pre_encodes_with_orjson(self, backend):
+        """Tests that blocks are only pre-encoded when it's cheaper."""
+        blocks = [{"type": "divider"}]
+        encoded = serialization.encode_blocks(blocks)
+        if backend == "fast":
+            assert encoded == '[{"type":"divider"}]'
+        else:
+            assert encoded is blocks
+
+    def test_dumps_matches_stdlib_json(self, backend):
+        """Tests that the encoded output is plain compact json."""
+        assert json.loads(serialization.dumps(PAYLOAD)) == PAYLOAD
+        assert ", " not in serialization.dumps([1, 2])
+
+    def test_slim_response_keeps_only_used_fields(self):
+        """Tests that unused article fields are dropped."""
+        payload = json.loads(json.dumps(PAYLOAD))
+
+        slim = serialization.slim_response(payload)
+
+        assert slim["totalResults"] == 1
+        assert slim["articles"] == [{
+            "title": "Title ü",
+            "description": "description",
+            "url": "www.com",
+            "urlToImage": None,
+            "publishedAt": "2021-03-01T01:01:01Z",
+            "source": {"name": "Source"},
+        }]
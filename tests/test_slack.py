@@ -2,9 +2,32 @@ import pytest
 import datetime
 
 import pytz
+from slack_sdk.errors import SlackApiError
 
 from newsie import config
+from newsie import serialization
 from newsie import slack
+from newsie.cache import JsonFileCache
+from tests.conftest import make_articles
+
+
+def make_digest_helper(mocker, mode):
+    mocker.patch.object(slack, "WebClient", autospec=True)
+    helper = slack.SlackFacade(update_mode=mode, message_store=JsonFileCache(None))
+    posted = []
+
+    def post_message(**kwargs):
+        posted.append(kwargs)
+        return {"ok": True, "channel": "C1", "ts": f"{len(posted)}.0"}
+
+    helper.client.chat_postMessage.side_effect = post_message
+    helper.client.chat_update.side_effect = (
+        lambda **kwargs: {"ok": True, "channel": "C1", "ts": kwargs["ts"]})
+    return helper
+
+
+def slack_error(error):
+    return SlackApiError(error, {"ok": False, "error": error})
 
 
 class TestSlack:
@@ -28,7 +51,7 @@ class TestSlack:
         helper.client.chat_postMessage.assert_called_once_with(
             channel=channel,
             text="Newsie Incoming!",
-            blocks=blocks,
+            blocks=serialization.encode_blocks(blocks),
             username=helper.bot_name,
             icon_emoji=helper.icon_emoji
         )
@@ -297,3 +320,217 @@ class TestSlack:
         ]
 
         assert self.client.create_rich_message_layout(name, input_obj, cont=True) == expected
+
+    def test_format_article_blocks_prefers_summary(self):
+        """Tests that an enriched article's summary replaces its description."""
+        input_obj = [{
+            "title": "Title",
+            "description": "description",
+            "summary": "summary",
+            "url": "www.com",
+            "urlToImage": "www.image.com",
+            "source": {"name": "source"},
+            "publishedAt": "2021-03-01T01:01:01Z"
+        }]
+
+        blocks = self.client.format_article_blocks(input_obj)
+        assert blocks[1]["text"]["text"].endswith("\nsummary.")
+
+    def test_format_article_block_uses_placeholder_for_bad_image(self, mocker):
+        """Tests that images the probe knows are broken get the placeholder."""
+        probe = mocker.Mock()
+        probe.is_bad.return_value = True
+        helper = slack.SlackFacade(image_probe=probe)
+        utc_dt = datetime.datetime(2021, 3, 1, 1, 1, 1).replace(
+            tzinfo=pytz.utc)
+
+        block = helper.format_article_block(
+            "title", "description", "source", utc_dt, "bad.jpg")
+
+        probe.is_bad.assert_called_once_with("bad.jpg")
+        assert block["accessory"]["image_url"] == slack.PLACEHOLDER_IMAGE
+
+    def test_constructor_raises_for_unknown_update_mode(self):
+        """Tests that an unknown update mode is rejected."""
+        with pytest.raises(ValueError, match=slack.UPDATE_MODE_ERROR_TEXT):
+            slack.SlackFacade(update_mode="nope")
+
+    def test_emit_updates_message_with_ts(self, mocker):
+        """Tests that emit edits the message in place when given a ts."""
+        mocker.patch.object(slack, "WebClient", autospec=True)
+        helper = slack.SlackFacade()
+        _ = helper.emit(["blocks"], "C1", ts="1.0")
+        helper.client.chat_update.assert_called_once_with(
+            channel="C1", ts="1.0", text="Newsie Incoming!",
+            blocks=serialization.encode_blocks(["blocks"]))
+        helper.client.chat_postMessage.assert_not_called()
+
+    def test_diff_messages_keeps_articles_in_their_messages(self):
+        """Tests that kept articles stay put and new ones go at the end."""
+        previous = [["a", "b"], ["c", "d"], ["e"]]
+        assert slack.diff_messages(previous, ["a", "b", "c", "d", "e"], n=2) == [
+            [0, 1], [2, 3], [4]]
+        assert slack.diff_messages(previous, ["x", "a", "b", "c", "d"], n=2) == [
+            [1, 2], [3, 4], [], [0]]
+        assert slack.diff_messages(previous, ["a", "c", "d", "e", "y"], n=2) == [
+            [0], [1, 2], [3, 4]]
+
+    def test_update_mode_posts_first_digest(self, mocker):
+        """Tests that the first digest is posted and remembered."""
+        helper = make_digest_helper(mocker, "update")
+
+        helper.send_messages("test", make_articles(0, 10), "#chan")
+
+        assert helper.client.chat_postMessage.call_count == 2
+        stored = helper.message_store.get("test|#chan")
+        assert stored["channel_id"] == "C1"
+        assert [m["ts"] for m in stored["messages"]] == ["1.0", "2.0"]
+
+    def test_update_mode_edits_only_changed_messages(self, mocker):
+        """Tests that a refresh only updates the messages that changed."""
+        helper = make_digest_helper(mocker, "update")
+        helper.send_messages("test", make_articles(0, 10), "#chan")
+        helper.client.chat_postMessage.reset_mock()
+
+        helper.send_messages("test", make_articles(0, 9) + make_articles(20, 21), "#chan")
+
+        helper.client.chat_postMessage.assert_not_called()
+        helper.client.chat_update.assert_called_once()
+        assert helper.client.chat_update.call_args.kwargs["ts"] == "2.0"
+        assert helper.client.chat_update.call_args.kwargs["channel"] == "C1"
+
+    def test_update_mode_head_insertion_edits_one_message(self, mocker):
+        """Tests that a new top headline doesn't shift every message."""
+        helper = make_digest_helper(mocker, "update")
+        helper.send_messages("test", make_articles(0, 16), "#chan")
+        helper.client.chat_postMessage.reset_mock()
+
+        helper.send_messages("test", make_articles(16, 17) + make_articles(0, 16), "#chan")
+
+        helper.client.chat_update.assert_not_called()
+        helper.client.chat_postMessage.assert_called_once()
+        assert "www.16.com" in str(helper.client.chat_postMessage.call_args.kwargs["blocks"])
+        stored = helper.message_store.get("test|#chan")
+        assert [m["urls"] for m in stored["messages"]] == [
+            [f"www.{n}.com" for n in range(0, 8)],
+            [f"www.{n}.com" for n in range(8, 16)],
+            ["www.16.com"],
+        ]
+
+    def test_update_mode_skips_unchanged_digest(self, mocker):
+        """Tests that an unchanged digest costs no api calls."""
+        helper = make_digest_helper(mocker, "update")
+        helper.send_messages("test", make_articles(0, 10), "#chan")
+        helper.client.chat_postMessage.reset_mock()
+
+        helper.send_messages("test", make_articles(0, 10), "#chan")
+
+        helper.client.chat_postMessage.assert_not_called()
+        helper.client.chat_update.assert_not_called()
+
+    def test_update_mode_deletes_leftover_messages(self, mocker):
+        """Tests that messages no longer needed are deleted."""
+        helper = make_digest_helper(mocker, "update")
+        helper.send_messages("test", make_articles(0, 10), "#chan")
+
+        helper.send_messages("test", make_articles(0, 8), "#chan")
+
+        helper.client.chat_delete.assert_called_once_with(channel="C1", ts="2.0")
+        assert len(helper.message_store.get("test|#chan")["messages"]) == 1
+
+    def test_thread_mode_replies_with_new_articles(self, mocker):
+        """Tests that only unseen articles are posted, as thread replies."""
+        helper = make_digest_helper(mocker, "thread")
+        helper.send_messages("test", make_articles(0, 4), "#chan")
+        helper.client.chat_postMessage.reset_mock()
+
+        helper.send_messages("test", make_articles(2, 7), "#chan")
+        helper.send_messages("test", make_articles(2, 7), "#chan")
+
+        helper.client.chat_postMessage.assert_called_once()
+        kwargs = helper.client.chat_postMessage.call_args.kwargs
+        assert kwargs["thread_ts"] == "1.0"
+        assert kwargs["channel"] == "C1"
+        assert "www.6.com" in str(kwargs["blocks"])
+        assert "www.3.com" not in str(kwargs["blocks"])
+
+    def test_stale_digest_is_posted_afresh(self, mocker):
+        """Tests that digests older than the max age aren't edited."""
+        helper = make_digest_helper(mocker, "update")
+        helper.send_messages("test", make_articles(0, 4), "#chan")
+        stored = helper.message_store.get("test|#chan")
+        stored["created"] -= config.SLACK_DIGEST_MAX_AGE + 1
+        helper.client.chat_postMessage.reset_mock()
+
+        helper.send_messages("test", make_articles(0, 4), "#chan")
+
+        helper.client.chat_postMessage.assert_called_once()
+        helper.client.chat_update.assert_not_called()
+
+    def test_update_mode_reposts_deleted_messages(self, mocker):
+        """Tests that a message deleted in Slack is posted again."""
+        helper = make_digest_helper(mocker, "update")
+        helper.send_messages("test", make_articles(0, 4), "#chan")
+        helper.client.chat_update.side_effect = slack_error("message_not_found")
+
+        helper.send_messages("test", make_articles(1, 5), "#chan")
+
+        assert helper.client.chat_postMessage.call_count == 2
+        stored = helper.message_store.get("test|#chan")
+        assert [m["ts"] for m in stored["messages"]] == ["2.0"]
+
+    def test_delete_ignores_missing_messages(self, mocker):
+        """Tests that deleting a message that's already gone isn't an error."""
+        helper = make_digest_helper(mocker, "update")
+        helper.send_messages("test", make_articles(0, 10), "#chan")
+        helper.client.chat_delete.side_effect = slack_error("message_not_found")
+
+        helper.send_messages("test", make_articles(0, 8), "#chan")
+
+        assert len(helper.message_store.get("test|#chan")["messages"]) == 1
+
+    def test_delete_logs_and_raises_other_errors(self, mocker):
+        """Tests that other delete errors are logged like emit errors."""
+        helper = make_digest_helper(mocker, "update")
+        helper.client.chat_delete.side_effect = slack_error("not_authed")
+        log = mocker.patch.object(slack.logging, "error")
+
+        with pytest.raises(SlackApiError):
+            helper.delete("C1", "1.0")
+        log.assert_called_once_with("Slack encountered an error: not_authed")
+
+    def test_thread_mode_reposts_deleted_digest(self, mocker):
+        """Tests that a digest whose parent message is gone is posted afresh."""
+        helper = make_digest_helper(mocker, "thread")
+        helper.send_messages("test", make_articles(0, 4), "#chan")
+        post_message = helper.client.chat_postMessage.side_effect
+
+        def fail_replies(**kwargs):
+            if "thread_ts" in kwargs:
+                raise slack_error("thread_not_found")
+            return post_message(**kwargs)
+
+        helper.client.chat_postMessage.side_effect = fail_replies
+        helper.send_messages("test", make_articles(2, 6), "#chan")
+
+        stored = helper.message_store.get("test|#chan")
+        assert [m["ts"] for m in stored["messages"]] == ["2.0"]
+        assert stored["seen_urls"] == [f"www.{n}.com" for n in range(2, 6)]
+
+    @pytest.mark.parametrize("mode", ["update", "thread"])
+    def test_empty_first_digest_is_posted_afresh(self, mocker, mode):
+        """Tests that a digest that posted nothing isn't edited or replied to."""
+        helper = make_digest_helper(mocker, mode)
+        helper.send_messages("test", [], "#chan")
+
+        helper.send_messages("test", make_articles(0, 4), "#chan")
+        helper.send_messages("test", make_articles(0, 5), "#chan")
+
+        stored = helper.message_store.get("test|#chan")
+        assert stored["channel_id"] == "C1"
+        assert helper.client.chat_postMessage.call_args_list[0].kwargs["channel"] == "#chan"
+        if mode == "update":
+            helper.client.chat_update.assert_called_once()
+            assert helper.client.chat_update.call_args.kwargs["channel"] == "C1"
+        else:
+            assert helper.client.chat_postMessage.call_args.kwargs["thread_ts"] == "1.0"